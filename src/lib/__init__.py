@@ -26,5 +26,4 @@
 import config
 import io
 import util
-import ui
 
@@ -293,6 +293,16 @@ class OpenPlaylistFileSelector(FileSelector):
 		self.add_filter(filter)
 
 
+class SaveRecordingFileSelector(FileSelector):
+	"A file selector for saving recordings"
+
+	def __init__(self, parent, defaultfile = None):
+		FileSelector.__init__(self, parent, "Select File to Record To", gtk.FILE_CHOOSER_ACTION_SAVE)
+
+		if defaultfile != None:
+			self.set_current_name(defaultfile)
+
+
 class SavePlaylistFileSelector(FileSelector):
 	"A file selector for saving playlists"
 
@@ -533,7 +543,7 @@ class OpenLocation(Utility):
 
 
 class StationList(Utility):
-	"A dialog for selecting a station"
+	"A dialog for selecting a station, which is hidden between runs"
 
 	def __init__(self, parent, stationlist, config = None):
 		Utility.__init__(
@@ -544,7 +554,8 @@ class StationList(Utility):
 		self.config = config
 
 		self.stationlist = stationlist
-		self.stationlist.connect("changed", self.__cb_stationlist_changed)
+		self.stationlistid = self.stationlist.connect("stations-changed", self.__cb_stationlist_changed)
+		self.connect("destroy", lambda w: self.stationlist.disconnect(self.stationlistid))
 
 		self.set_resizable(True)
 
@@ -568,10 +579,10 @@ class StationList(Utility):
 		vbox.pack_start(self.scrolledwindow)
 
 
-	def __cb_stationlist_changed(self, widget, data = None):
+	def __cb_stationlist_changed(self, widget, changes):
 		"Callback for stationlist changes"
 
-		self.treeview.set_stations(self.stationlist)
+		self.treeview.apply_changes(self.stationlist, changes)
 
 
 	def __cb_tree_edit(self, widget, data = None):
@@ -647,6 +658,12 @@ class StationList(Utility):
 			self.get_button(0).set_sensitive(True)
 
 
+	def get_neighbours(self, station):
+		"Returns the stations shown next to a station, in the list order"
+
+		return self.treeview.get_neighbours(station)
+
+
 	def run(self):
 		"Runs the dialog"
 
@@ -670,18 +687,19 @@ class StationList(Utility):
 				self.config.set("ui/window-stationlist-height", height)
 
 
+			# the dialog is kept, and follows station list changes while hidden
 			if response == gtk.RESPONSE_OK:
 				station = self.treeview.get_selected_station()
 
 				if station == None:
 					continue
 
-				self.destroy()
+				self.hide()
 
 				return station
 
 			else:
-				self.destroy()
+				self.hide()
 				raise CancelError
 
 
@@ -23,7 +23,7 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
-import gnomevfs, os, re
+import gnomevfs, os, re, StringIO
 
 
 def basename(file):
@@ -99,6 +99,31 @@ def read(file, bytes = None):
 		raise IOError, (file, reason)
 
 
+def read_chunks(file, size = 65536):
+	"Reads data from a file in chunks, as an iterator"
+
+	try:
+		if file == None:
+			raise IOError
+
+		file	= normpath(file)
+		handle	= gnomevfs.Handle(file)
+
+		while 1:
+			data = handle.read(size)
+
+			if data == "":
+				return
+
+			yield data
+
+	except gnomevfs.EOFError:
+		return
+
+	except gnomevfs.Error, reason:
+		raise IOError, (file, reason)
+
+
 def url_hostname(url):
 	"Extracts the hostname from an URL"
 
@@ -138,3 +163,43 @@ def write(file, data):
 	except gnomevfs.Error:
 		raise IOError
 
+
+def write_atomic(file, writer):
+	"Writes a file through a callback taking a file object, replacing it atomically"
+
+	try:
+		if file == None:
+			raise IOError
+
+		file = normpath(file)
+
+		# remote files can't be renamed into place
+		if url_valid(file) == True:
+			data = StringIO.StringIO()
+			writer(data)
+			write(file, data.getvalue())
+
+			return
+
+		if os.access(os.path.dirname(file), os.F_OK) == False:
+			os.makedirs(os.path.dirname(file))
+
+		temp	= "%s.%i.tmp" % ( file, os.getpid() )
+		f	= open(temp, "wb")
+
+		try:
+			writer(f)
+
+			f.flush()
+			os.fsync(f.fileno())
+			f.close()
+
+		except:
+			f.close()
+			os.remove(temp)
+			raise
+
+		os.rename(temp, file)
+
+	except ( gnomevfs.Error, OSError ):
+		raise IOError
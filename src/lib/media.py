@@ -23,18 +23,50 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
-import util
-import gobject, gst, gtk, math, re, xml.dom.minidom
+import io, util
+import gobject, gst, math, mmap, os, re, StringIO, sys, tempfile, threading, time, types, xml.dom.minidom, xml.parsers.expat, zlib
 from xml.parsers.expat import ExpatError
 
+try:
+	from pysqlite2 import dbapi2 as sqlite
+
+except ImportError:
+	try:
+		import sqlite3 as sqlite
+
+	except ImportError:
+		sqlite = None
+
 
 STATE_ERROR		= "error"
 STATE_STOPPED		= "stopped"
 STATE_CONNECTING	= "connecting"
 STATE_BUFFERING		= "buffering"
 STATE_PLAYING		= "playing"
+STATE_PAUSED		= "paused"
 STATE_RECORDING		= "recording"
 
+# kinds of station list changes, reported with the affected index
+CHANGE_ADD		= "add"
+CHANGE_REMOVE		= "remove"
+CHANGE_UPDATE		= "update"
+
+# mpeg audio bitrates in kbps, by mpeg-1 or not and layer (3 is layer i),
+# and sample rates by version (0 is mpeg-2.5, 2 mpeg-2 and 3 mpeg-1)
+MPEG_BITRATES		= {
+	( True, 3 )	: ( 0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448 ),
+	( True, 2 )	: ( 0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384 ),
+	( True, 1 )	: ( 0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320 ),
+	( False, 3 )	: ( 0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256 ),
+	( False, 2 )	: ( 0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160 ),
+	( False, 1 )	: ( 0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160 ),
+}
+MPEG_SAMPLERATES	= {
+	0	: ( 11025, 12000, 8000 ),
+	2	: ( 22050, 24000, 16000 ),
+	3	: ( 44100, 48000, 32000 ),
+}
+
 
 class DataError(Exception):
 	"Exception for data errors"
@@ -50,34 +82,175 @@ class PluginError(Exception):
 
 
 
+class Capture(gst.Pipeline):
+	"A pipeline recording a stream to disk, without decoding or playing it"
+
+	def __init__(self, uri, file, writer, split = False, preroll = 0, postroll = 0):
+		gst.Pipeline.__init__(self)
+
+		self.bus	= self.get_bus()
+		self.uri	= uri
+
+		self.source	= self.__init_source()
+		self.add(self.source)
+
+		# without a file, the stream is connected but not written
+		# until open() is called
+		self.recorder	= Recorder(file, writer, split, preroll, postroll)
+		self.add(self.recorder)
+
+		self.source.link(self.recorder)
+
+
+	def __init_source(self):
+		"Sets up the source"
+
+		source = None
+
+		for plugin in "gnomevfssrc", "neonhttpsrc":
+			try:
+				source = gst.element_factory_make(plugin, "source")
+				break
+
+			except gst.PluginNotFoundError:
+				pass
+
+		if source == None:
+			raise PluginError("Couldn't find neonhttpsrc or gnomevfs gstreamer plugins")
+
+		source.set_property("iradio-mode", True)
+		source.connect("notify::iradio-title", self.__cb_source_title)
+
+		try:
+			source.set_property("location", self.uri)
+
+		except TypeError:
+			source.set_property("uri", self.uri)
+
+		return source
+
+
+	def __cb_source_title(self, source, property):
+		"Callback for stream titles, from the streaming thread"
+
+		self.recorder.set_title(source.get_property("iradio-title"))
+
+
+	def close(self):
+		"Stops writing to the current file, but keeps the stream connected"
+
+		self.recorder.close()
+
+
+	def get_bytes(self):
+		"Returns the number of bytes recorded"
+
+		return self.recorder.bytes
+
+
+	def get_error(self):
+		"Returns the error which stopped the recording, if any"
+
+		return self.recorder.error
+
+
+	def get_received(self):
+		"Returns the number of bytes received from the stream"
+
+		return self.recorder.received
+
+
+	def open(self, file):
+		"Starts writing the stream to a file"
+
+		self.recorder.open(file)
+
+
+	def start(self):
+		"Starts capturing"
+
+		if self.set_state(gst.STATE_PLAYING) == gst.STATE_CHANGE_FAILURE:
+			raise PlayError
+
+
+	def stop(self):
+		"Stops capturing, and closes the recording"
+
+		self.set_state(gst.STATE_NULL)
+		self.recorder.close()
+
+
+
 class Pipeline(gst.Pipeline):
 	"A media pipeline"
 
-	def __init__(self):
+	def __init__(self, timeshift = 1800):
 		gst.Pipeline.__init__(self)
 
+		self.bufferbytes	= 0
+		self.buffercount	= 0
 		self.bufferprobe	= None
+		self.bufferreport	= ( 0, -1 )
 		self.bus		= self.get_bus()
+		self.lastused		= time.time()
+		self.prepared		= False
+		self.recorder		= None
+		self.tags		= {}
 		self.uri		= None
 
+		# buffer depth in seconds, adjusted on underruns
+		self.bitrate		= 128000
+		self.latency		= 2.0
+		self.latencytimer	= None
+		self.maxlatency		= 30.0
+		self.minlatency		= 2.0
+		self.running		= False
+		self.underrun		= time.time()
+
+		# minimum interval in seconds and fill change between buffering reports
+		self.bufferinterval	= 0.25
+		self.bufferstep		= 0.05
+
+		# the received stream is kept in a ring buffer, sized in
+		# seconds at the default bitrate, and played from a cursor.
+		# it is only allocated while connected, and standby
+		# pipelines keep a short one until they are played
+		self.timeshift		= timeshift
+		self.ring		= None
+
 		# set up pipeline elements
 		self.converter		= self.__init_converter()
 		self.decoder		= self.__init_decoder()
 		self.queue		= self.__init_queue()
-		self.sink		= self.__init_sink()
+		self.ringsink		= self.__init_ringsink()
+		self.ringsource		= self.__init_ringsource()
 		self.source		= self.__init_source()
+		self.tee		= self.__init_tee()
 		self.volume		= self.__init_volume()
 
+		# the audio device is only opened by the playing pipeline,
+		# standby pipelines play into a fake sink instead
+		self.audiosink		= self.__init_sink()
+		self.standbysink	= self.__init_standbysink()
+		self.sink		= self.audiosink
+
 		# add elements to pipeline
 		self.add(self.source)
+		self.add(self.tee)
+		self.add(self.ringsink)
+		self.add(self.ringsource)
 		self.add(self.queue)
 		self.add(self.decoder)
 		self.add(self.converter)
 		self.add(self.volume)
 		self.add(self.sink)
 
-		# link pipeline elements (decoder/converter will be linked later)
-		self.source.link(self.queue)
+		# link pipeline elements (decoder/converter will be linked later,
+		# and recorders are attached to the tee while recording)
+		self.source.link(self.tee)
+		self.tee.link(self.ringsink)
+
+		self.ringsource.link(self.queue)
 		self.queue.link(self.decoder)
 
 		self.converter.link(self.volume)
@@ -107,17 +280,43 @@ class Pipeline(gst.Pipeline):
 
 		queue = gst.element_factory_make("queue", "queue")
 
+		# the stream isn't timestamped before decoding, so the
+		# queue is sized in bytes based on the stream bitrate
 		queue.set_property("max-size-buffers", 0)
 		queue.set_property("max-size-time", 0)
-		queue.set_property("max-size-bytes", 64 * 1024)
-		queue.set_property("min-threshold-bytes", 32 * 1024)
+		queue.set_property("max-size-bytes", self.__get_latency_bytes() * 2)
+		queue.set_property("min-threshold-bytes", self.__get_latency_bytes())
 
 		queue.connect("running", self.__cb_queue_running)
+		queue.connect("underrun", self.__cb_queue_underrun)
 		self.bufferprobe = queue.get_pad("sink").add_buffer_probe(self.__cb_queue_buffer)
 
 		return queue
 
 
+	def __init_ringsink(self):
+		"Sets up the sink writing the received stream to the ring buffer"
+
+		ringsink = gst.element_factory_make("fakesink", "ringsink")
+		ringsink.set_property("signal-handoffs", True)
+		ringsink.set_property("sync", False)
+		ringsink.connect("handoff", self.__cb_ringsink_handoff)
+		ringsink.get_pad("sink").add_event_probe(self.__cb_ringsink_event)
+
+		# the received stream keeps running while playback is paused
+		ringsink.set_locked_state(True)
+
+		return ringsink
+
+
+	def __init_ringsource(self):
+		"Sets up the source playing from the ring buffer"
+
+		ringsource = RingSource(self.ring)
+
+		return ringsource
+
+
 	def __init_sink(self):
 		"Sets up the sink"
 
@@ -154,10 +353,28 @@ class Pipeline(gst.Pipeline):
 		source.connect("notify::iradio-genre", self.__cb_source_iradio)
 		source.connect("notify::iradio-title", self.__cb_source_iradio)
 		source.connect("notify::iradio-url", self.__cb_source_iradio)
+		source.set_locked_state(True)
 
 		return source
 
 
+	def __init_standbysink(self):
+		"Sets up the sink used while on standby"
+
+		standbysink = gst.element_factory_make("fakesink", "standbysink")
+
+		return standbysink
+
+
+	def __init_tee(self):
+		"Sets up the tee for the compressed stream"
+
+		tee = gst.element_factory_make("tee", "tee")
+		tee.set_locked_state(True)
+
+		return tee
+
+
 	def __init_volume(self):
 		"Sets up the volume controller"
 
@@ -191,18 +408,56 @@ class Pipeline(gst.Pipeline):
 		self.__bus_post_error("Unknown stream format")
 
 
+	def __cb_latency_timer(self):
+		"Callback for shrinking the buffer while the stream is stable"
+
+		if time.time() - self.underrun < 60:
+			return True
+
+		if self.latency > self.minlatency:
+			self.underrun = time.time()
+			self.__set_latency(self.latency * 0.9)
+
+		return True
+
+
+	def __cb_latency_underrun(self):
+		"Callback for growing the buffer after an underrun"
+
+		self.underrun = time.time()
+		self.__set_latency(self.latency * 1.5)
+
+		return False
+
+
 	def __cb_queue_buffer(self, pad, buffer):
 		"Callback for queue buffer changes"
 
-		try:
-			threshold	= self.queue.get_property("min-threshold-bytes")
-			level		= self.queue.get_property("current-level-bytes")
-			progress	= min(float(level) / threshold, 1)
+		# this is called for every buffer on the streaming thread, so
+		# avoid queue lookups and only report progress now and then
+		self.bufferbytes	+= buffer.size
+		self.buffercount	+= 1
+
+		threshold	= self.__get_latency_bytes()
+		progress	= min(float(self.bufferbytes) / threshold, 1)
+
+		lasttime, lastprogress = self.bufferreport
+		now = time.time()
+
+		if progress == lastprogress:
+			return True
 
-		except ZeroDivisionError:
-			progress	= 0
+		elif progress < 1 and abs(progress - lastprogress) < self.bufferstep and now - lasttime < self.bufferinterval:
+			return True
+
+		self.bufferreport = ( now, progress )
 
-		self.__bus_post_custom(gst.MESSAGE_BUFFERING, { "buffer-fill" : progress })
+		self.__bus_post_custom(gst.MESSAGE_BUFFERING, {
+			"buffer-fill"		: progress,
+			"buffer-bytes"		: self.bufferbytes,
+			"buffer-count"		: self.buffercount,
+			"threshold-bytes"	: threshold,
+		})
 
 		return True
 
@@ -210,6 +465,8 @@ class Pipeline(gst.Pipeline):
 	def __cb_queue_running(self, queue, data = None):
 		"Callback for queue overruns"
 
+		self.running = True
+
 		if self.bufferprobe == None:
 			return
 
@@ -219,6 +476,58 @@ class Pipeline(gst.Pipeline):
 		queue.get_pad("sink").remove_buffer_probe(probeid)
 
 
+	def __cb_queue_underrun(self, queue, data = None):
+		"Callback for queue underruns"
+
+		if self.running == False:
+			return
+
+		# called from the streaming thread, adjust the queue from the main loop
+		gobject.idle_add(self.__cb_latency_underrun)
+
+
+	def __cb_recorder_blocked(self, pad, blocked, recorder):
+		"Callback for blocked recorder pads"
+
+		# called from the streaming thread, so only unlink the
+		# recorder here, and remove it from the main loop
+		pad.unlink(recorder.get_pad("sink"))
+		pad.set_blocked_async(False, lambda pad, blocked: None)
+
+		gobject.idle_add(self.__cb_recorder_remove, pad, recorder)
+
+
+	def __cb_recorder_remove(self, pad, recorder):
+		"Callback for removing a recorder from the pipeline"
+
+		if pad.is_linked() == True:
+			pad.unlink(recorder.get_pad("sink"))
+
+		self.tee.release_request_pad(pad)
+
+		recorder.set_state(gst.STATE_NULL)
+		self.remove(recorder)
+		recorder.close()
+
+		return False
+
+
+	def __cb_ringsink_event(self, pad, event):
+		"Callback for events on the received stream"
+
+		# let playback reach the end of the stream from the ring buffer
+		if event.type == gst.EVENT_EOS:
+			self.ring.set_eos(True)
+
+		return True
+
+
+	def __cb_ringsink_handoff(self, sink, buffer, pad):
+		"Callback for received buffers, from the streaming thread"
+
+		self.ring.write(buffer.data)
+
+
 	def __cb_source_iradio(self, source, property):
 		"Callback for iradio metadata"
 
@@ -263,44 +572,109 @@ class Pipeline(gst.Pipeline):
 		self.__bus_post_custom(gst.MESSAGE_TAG, tags)
 
 
-	def get_duration(self):
-		"Returns the current duration as seconds"
+	def __get_cursor(self):
+		"Returns the ring buffer offset being played"
 
-		try:
-			duration, format = self.query_duration(gst.FORMAT_TIME)
+		return self.ringsource.cursor - self.queue.get_property("current-level-bytes")
 
-			return int(duration / 1000000000)
 
-		except gst.QueryError:
-			return 0
+	def __get_latency_bytes(self):
+		"Returns the number of bytes needed to buffer the target latency"
 
+		return max(int(self.latency * self.bitrate / 8), 4096)
 
-	def get_position(self):
-		"Returns the current position as seconds"
 
-		try:
-			position, format = self.query_position(gst.FORMAT_TIME)
+	def __get_ring_bytes(self):
+		"Returns the size of the ring buffer"
 
-			return int(position / 1000000000)
+		return max(int(self.timeshift * 128000 / 8), 65536)
 
-		except gst.QueryError:
-			return 0
 
+	def __get_standby_bytes(self):
+		"Returns the size of the ring buffer while on standby"
 
-	def get_volume(self):
-		"Returns the current volume"
+		return max(int(self.maxlatency * self.bitrate / 8), 65536)
 
-		return self.volume.get_property("volume")
 
+	def __get_title(self, taglist):
+		"Returns the track title from a tag list"
 
-	def play(self, uri):
-		"Plays an URI"
+		if taglist.get("iradio-title") not in ( None, "" ):
+			return taglist["iradio-title"]
 
-		self.uri = uri
+		elif taglist.has_key("artist") and taglist.has_key("title"):
+			return ("%s - %s" % ( taglist["artist"], taglist["title"] )).strip(" -")
+
+		return None
+
+
+	def __seek(self, offset):
+		"Moves playback to an offset in the ring buffer"
+
+		state = self.get_state(0)[1]
+
+		if state not in ( gst.STATE_PLAYING, gst.STATE_PAUSED ):
+			raise PlayError
+
+		# the queue is flushed, which shouldn't count as an underrun
+		self.running = False
+
+		if state == gst.STATE_PLAYING:
+			self.set_state(gst.STATE_PAUSED)
+
+		self.ringsource.seek_cursor(offset)
+		self.set_new_stream_time(0)
+
+		if state == gst.STATE_PLAYING:
+			self.set_state(gst.STATE_PLAYING)
+
+
+	def __set_latency(self, latency):
+		"Sets the target buffer latency, in seconds"
+
+		self.latency = min(max(latency, self.minlatency), self.maxlatency)
+
+		self.queue.set_property("max-size-bytes", self.__get_latency_bytes() * 2)
+		self.queue.set_property("min-threshold-bytes", self.__get_latency_bytes())
 
-		# set up bufferprobe
-		if self.bufferprobe == None:
-			self.bufferprobe = self.queue.get_pad("sink").add_buffer_probe(self.__cb_queue_buffer)
+
+	def __set_receiver_state(self, state):
+		"Sets the state of the elements receiving the stream"
+
+		elements = [ self.ringsink, self.tee, self.source ]
+
+		# bring them up from downstream, and down from upstream
+		if state == gst.STATE_NULL:
+			elements.reverse()
+
+		# these are locked, so they keep running when playback is paused
+		for element in elements:
+			if element.set_state(state) == gst.STATE_CHANGE_FAILURE:
+				raise PlayError
+
+
+	def __set_ring(self, size):
+		"Allocates the ring buffer, or resizes it keeping the most recent data"
+
+		if self.ring == None:
+			self.ring		= RingBuffer(size)
+			self.ringsource.cursor	= 0
+			self.ringsource.ring	= self.ring
+
+		elif self.ring.size != size:
+			self.ring.resize(size)
+
+
+	def __set_sink(self, sink):
+		"Replaces the audio sink, stopping playback while relinking"
+
+		if self.sink == sink:
+			return
+
+		# the receiving elements are locked, so the stream
+		# keeps coming into the ring buffer meanwhile
+		if self.get_state(0)[1] != gst.STATE_NULL:
+			self.set_state(gst.STATE_READY)
 
 		# remove source pad from decoder, to avoid
 		# possible decodebin bug (src0 name crash)
@@ -309,6 +683,30 @@ class Pipeline(gst.Pipeline):
 		if pad != None:
 			self.decoder.remove_pad(pad)
 
+		self.volume.unlink(self.sink)
+		self.sink.set_state(gst.STATE_NULL)
+		self.remove(self.sink)
+
+		self.sink = sink
+		self.add(self.sink)
+		self.volume.link(self.sink)
+
+
+	def __set_source(self, uri):
+		"Sets up a new source for an URI"
+
+		self.running	= False
+		self.uri	= uri
+		self.tags	= {}
+
+		self.bufferbytes	= 0
+		self.buffercount	= 0
+		self.bufferreport	= ( 0, -1 )
+
+		# set up bufferprobe
+		if self.bufferprobe == None:
+			self.bufferprobe = self.queue.get_pad("sink").add_buffer_probe(self.__cb_queue_buffer)
+
 		# we need to set up the source again, due to bugs
 		# in plugin iradio-handling
 		self.source.set_state(gst.STATE_NULL)
@@ -317,7 +715,7 @@ class Pipeline(gst.Pipeline):
 
 		self.source = self.__init_source()
 		self.add(self.source)
-		self.source.link(self.queue)
+		self.source.link(self.tee)
 
 		try:
 			self.source.set_property("location", uri)
@@ -325,97 +723,533 @@ class Pipeline(gst.Pipeline):
 		except TypeError:
 			self.source.set_property("uri", uri)
 
-		if self.set_state(gst.STATE_PLAYING) == gst.STATE_CHANGE_FAILURE:
-			raise PlayError
 
+	def activate(self):
+		"Starts playback of a prepared pipeline"
 
-	def set_volume(self, volume):
-		"Sets the volume"
+		self.lastused = time.time()
+		self.underrun = time.time()
 
-		volume = min(volume, 1)
-		volume = max(volume, 0)
+		self.queue.set_property("leaky", 0)
+		self.volume.set_property("mute", False)
 
-		self.volume.set_property("volume", volume)
+		if self.latencytimer == None:
+			self.latencytimer = gobject.timeout_add(10000, self.__cb_latency_timer)
 
+		self.__set_receiver_state(gst.STATE_PLAYING)
+		self.__set_sink(self.audiosink)
 
-	def stop(self):
-		"Stops playback"
+		# a standby pipeline gets the full timeshift window, and
+		# plays from the live stream rather than where it was left
+		if self.prepared == True:
+			self.prepared = False
+			self.running = False
+			self.__set_ring(self.__get_ring_bytes())
 
-		self.set_state(gst.STATE_NULL)
+			start, end = self.ring.get_window()
+			self.ringsource.cursor = max(end - self.__get_latency_bytes(), start)
 
+		if self.set_state(gst.STATE_PLAYING) == gst.STATE_CHANGE_FAILURE:
+			raise PlayError
 
 
-class Player(gobject.GObject):
-	"Player for radio streams"
+	def add_tags(self, taglist):
+		"Merges a tag list into the pipeline tags"
 
-	__gsignals__ = {
-		"meta-changed"	: ( gobject.SIGNAL_ACTION, gobject.TYPE_NONE, ( gobject.TYPE_PYOBJECT, )),
-		"state-changed"	: ( gobject.SIGNAL_ACTION, gobject.TYPE_NONE, ( gobject.TYPE_STRING, gobject.TYPE_PYOBJECT )),
-	}
+		self.tags.update(taglist)
 
-	def __init__(self):
-		gobject.GObject.__init__(self)
+		# split recordings on track changes
+		if self.recorder != None:
+			self.recorder.set_title(self.__get_title(taglist))
 
-		self.state		= STATE_STOPPED
+		# size the buffer from the stream bitrate
+		for key in "nominal-bitrate", "bitrate":
+			if taglist.get(key, 0) > 0:
+				self.set_bitrate(taglist[key])
+				break
 
-		self.meta		= {
-			"name"			: None,
-			"description"		: None,
-			"website"		: None,
-			"playing"		: None,
-			"format"		: None,
-			"bitrate"		: None,
-			"codec"			: None,
-		}
+		else:
+			try:
+				self.set_bitrate(int(taglist["icy-br"]) * 1000)
 
-		self.pipeline = Pipeline()
-		self.pipeline.bus.add_watch(self.__cb_bus)
+			except ( KeyError, ValueError ):
+				pass
 
 
-	def __cb_bus(self, bus, message, data = None):
-		"Callback for bus messages"
+	def get_duration(self):
+		"Returns the length of the timeshift window as seconds"
 
-		# handle tag lists from any source
-		if message.type == gst.MESSAGE_TAG:
-			return self.__cb_bus_taglist(message)
+		if self.ring == None:
+			return 0
 
-		# skip messages not from pipeline
-		elif message.src != self.pipeline:
-			return True
+		start, end = self.ring.get_window()
 
-		# skip clock messages
-		elif message.type in ( gst.MESSAGE_CLOCK_PROVIDE, gst.MESSAGE_CLOCK_LOST, gst.MESSAGE_NEW_CLOCK ):
-			return True
+		return int((end - start) * 8 / self.bitrate)
 
-		# handle state changes
-		elif message.type == gst.MESSAGE_STATE_CHANGED:
-			return self.__cb_bus_state_changed(message)
 
-		# handle buffering
-		elif message.type == gst.MESSAGE_BUFFERING:
-			return self.__cb_bus_buffering(message)
+	def get_position(self):
+		"Returns the playback position in the timeshift window as seconds"
 
-		# handle end-of-stream
-		elif message.type == gst.MESSAGE_EOS:
-			return self.__cb_bus_eos(message)
+		if self.ring == None:
+			return 0
 
-		# handle errors
-		elif message.type == gst.MESSAGE_ERROR:
-			return self.__cb_bus_error(message)
+		start, end = self.ring.get_window()
 
-		# warn about unhandled messages
-		else:
-			print "Unhandled gst message:", message, "of type", message.type
+		return int(max(self.__get_cursor() - start, 0) * 8 / self.bitrate)
 
-		return True
 
+	def get_volume(self):
+		"Returns the current volume"
 
-	def __cb_bus_buffering(self, message):
-		"Callback for bus buffering messages"
+		return self.volume.get_property("volume")
 
-		bufferfill = message.structure["buffer-fill"]
 
-		if bufferfill == 1 or self.state == STATE_PLAYING:
+	def live(self):
+		"Moves playback to the live stream"
+
+		start, end = self.ring.get_window()
+
+		# start from the buffered latency, which is already in
+		# the ring buffer, so playback continues right away
+		self.__seek(max(end - self.__get_latency_bytes(), start))
+
+
+	def pause(self):
+		"Pauses playback, while the stream is still received into the ring buffer"
+
+		if self.latencytimer != None:
+			gobject.source_remove(self.latencytimer)
+			self.latencytimer = None
+
+		if self.set_state(gst.STATE_PAUSED) == gst.STATE_CHANGE_FAILURE:
+			raise PlayError
+
+
+	def play(self, uri):
+		"Plays an URI"
+
+		# remove source pad from decoder, to avoid
+		# possible decodebin bug (src0 name crash)
+		pad = self.decoder.get_pad("src0")
+
+		if pad != None:
+			self.decoder.remove_pad(pad)
+
+		self.__set_source(uri)
+		self.__set_ring(self.__get_ring_bytes())
+		self.ring.reset()
+
+		self.prepared = False
+		self.activate()
+
+
+	def prepare(self, uri):
+		"Connects to an URI and buffers it, without playing"
+
+		pad = self.decoder.get_pad("src0")
+
+		if pad != None:
+			self.decoder.remove_pad(pad)
+
+		self.__set_source(uri)
+		self.__set_ring(self.__get_standby_bytes())
+		self.ring.reset()
+		self.standby()
+
+
+	def record(self, file, writer, split = False, preroll = 0, postroll = 0):
+		"Starts recording the compressed stream to a file"
+
+		if self.recorder != None:
+			raise PlayError
+
+		self.recorder = Recorder(file, writer, split, preroll, postroll)
+		self.recorder.bitrate	= self.bitrate
+		self.recorder.title	= self.__get_title(self.tags)
+		self.add(self.recorder)
+
+		# bring the recorder up before linking, so
+		# the tee never pushes into a stopped element
+		self.recorder.set_state(gst.STATE_PLAYING)
+		self.recorder.set_locked_state(True)
+
+		if self.tee.link(self.recorder) == False:
+			recorder	= self.recorder
+			self.recorder	= None
+
+			recorder.set_state(gst.STATE_NULL)
+			self.remove(recorder)
+
+			raise PlayError
+
+
+	def reconnect(self, uri):
+		"Reconnects to an URI, keeping the decoder and sink running"
+
+		if self.get_state(0)[1] not in ( gst.STATE_PLAYING, gst.STATE_PAUSED ):
+			raise PlayError
+
+		# clear any end-of-stream or error state downstream
+		pad = self.ringsink.get_pad("sink")
+		pad.send_event(gst.event_new_flush_start())
+		pad.send_event(gst.event_new_flush_stop())
+
+		self.ring.set_eos(False)
+
+		# playback which reached the end continues where it stopped
+		if self.ringsource.eos == True:
+			self.ringsource.seek_cursor(self.ringsource.cursor)
+
+		self.__set_source(uri)
+
+		if self.source.set_state(gst.STATE_PLAYING) == gst.STATE_CHANGE_FAILURE:
+			raise PlayError
+
+
+	def resync(self):
+		"Restarts the running time from the played position, after a gap in the stream"
+
+		self.__seek(self.__get_cursor())
+
+
+	def rewind(self, seconds):
+		"Moves playback back in the timeshift window, or forward for negative values"
+
+		start, end	= self.ring.get_window()
+		offset		= self.__get_cursor() - int(seconds * self.bitrate / 8)
+
+		self.__seek(min(max(offset, start), end))
+
+
+	def set_bitrate(self, bitrate):
+		"Sets the stream bitrate, in bits per second"
+
+		if bitrate <= 0 or bitrate == self.bitrate:
+			return
+
+		self.bitrate = bitrate
+		self.__set_latency(self.latency)
+
+		if self.recorder != None:
+			self.recorder.bitrate = bitrate
+
+
+	def set_latency(self, minlatency, maxlatency):
+		"Sets the minimum and maximum buffer latency, in seconds"
+
+		self.minlatency = minlatency
+		self.maxlatency = max(minlatency, maxlatency)
+
+		self.__set_latency(self.latency)
+
+
+	def set_timeshift(self, timeshift):
+		"Sets the length of the timeshift window, in seconds at the default bitrate"
+
+		# the ring buffer is sized for it on the next playback
+		self.timeshift = timeshift
+
+
+	def set_volume(self, volume):
+		"Sets the volume"
+
+		volume = min(volume, 1)
+		volume = max(volume, 0)
+
+		self.volume.set_property("volume", volume)
+
+
+	def standby(self):
+		"Keeps the pipeline connected and buffering, without playing"
+
+		self.lastused = time.time()
+		self.prepared = True
+
+		# only the most recent part of the stream is kept
+		self.__set_ring(self.__get_standby_bytes())
+		self.__set_sink(self.standbysink)
+
+		# let the queue drop old data when full, so it
+		# holds the most recent part of the stream
+		self.queue.set_property("leaky", 2)
+		self.volume.set_property("mute", True)
+
+		if self.latencytimer != None:
+			gobject.source_remove(self.latencytimer)
+			self.latencytimer = None
+
+		self.__set_receiver_state(gst.STATE_PLAYING)
+
+		if self.set_state(gst.STATE_PAUSED) == gst.STATE_CHANGE_FAILURE:
+			raise PlayError
+
+
+	def stop(self):
+		"Stops playback"
+
+		if self.latencytimer != None:
+			gobject.source_remove(self.latencytimer)
+			self.latencytimer = None
+
+		# stop receiving first, so a recorder can be removed right away
+		self.source.set_state(gst.STATE_NULL)
+		self.stop_recording()
+
+		self.set_state(gst.STATE_NULL)
+		self.__set_receiver_state(gst.STATE_NULL)
+
+		self.prepared = False
+
+		if self.ring != None:
+			self.ring.close()
+			self.ring		= None
+			self.ringsource.ring	= None
+
+
+	def stop_recording(self):
+		"Stops recording, without interrupting playback"
+
+		if self.recorder == None:
+			return
+
+		recorder	= self.recorder
+		self.recorder	= None
+		pad		= recorder.get_pad("sink").get_peer()
+
+		if pad == None:
+			recorder.set_state(gst.STATE_NULL)
+			self.remove(recorder)
+			recorder.close()
+
+		# wait for the tee to be between buffers before unlinking
+		elif self.source.get_state(0)[1] == gst.STATE_PLAYING:
+			pad.set_blocked_async(True, self.__cb_recorder_blocked, recorder)
+
+		else:
+			self.__cb_recorder_remove(pad, recorder)
+
+
+
+class PipelinePool(gobject.GObject):
+	"A pool of connected standby pipelines"
+
+	def __init__(self, size = 3, idle = 300):
+		gobject.GObject.__init__(self)
+
+		self.idle	= idle
+		self.size	= size
+		self.pipelines	= []
+		self.timer	= None
+		self.watches	= {}
+
+
+	def __cb_bus(self, bus, message, pipeline):
+		"Callback for standby pipeline bus messages"
+
+		if message.type == gst.MESSAGE_TAG:
+			pipeline.add_tags(dict(message.structure))
+
+		elif message.type in ( gst.MESSAGE_EOS, gst.MESSAGE_ERROR ):
+			self.remove(pipeline)
+
+		return True
+
+
+	def __cb_evict(self):
+		"Callback for evicting idle pipelines"
+
+		expiry = time.time() - self.idle
+
+		for pipeline in self.pipelines[:]:
+			if pipeline.lastused < expiry:
+				self.remove(pipeline)
+
+		if len(self.pipelines) == 0:
+			self.timer = None
+			return False
+
+		return True
+
+
+	def add(self, pipeline):
+		"Adds a standby pipeline to the pool"
+
+		if self.size < 1:
+			pipeline.stop()
+			return
+
+		if pipeline in self.pipelines:
+			self.pipelines.remove(pipeline)
+
+		else:
+			self.watches[pipeline] = pipeline.bus.add_watch(self.__cb_bus, pipeline)
+
+		self.pipelines.append(pipeline)
+
+		# evict least recently used pipelines
+		while len(self.pipelines) > self.size:
+			self.remove(self.pipelines[0])
+
+		if self.timer == None:
+			self.timer = gobject.timeout_add(10000, self.__cb_evict)
+
+
+	def clear(self):
+		"Stops and removes all pipelines"
+
+		for pipeline in self.pipelines[:]:
+			self.remove(pipeline)
+
+
+	def find(self, uris):
+		"Returns the pooled pipeline for one of a list of uris, if any"
+
+		for pipeline in self.pipelines:
+			if pipeline.uri in uris:
+				return pipeline
+
+		return None
+
+
+	def remove(self, pipeline):
+		"Stops and removes a pipeline from the pool"
+
+		self.take(pipeline)
+		pipeline.stop()
+
+
+	def take(self, pipeline):
+		"Removes a pipeline from the pool, without stopping it"
+
+		if pipeline not in self.pipelines:
+			return None
+
+		self.pipelines.remove(pipeline)
+		gobject.source_remove(self.watches[pipeline])
+		del self.watches[pipeline]
+
+		return pipeline
+
+
+
+class Player(gobject.GObject):
+	"Player for radio streams"
+
+	__gsignals__ = {
+		"meta-changed"	: ( gobject.SIGNAL_ACTION, gobject.TYPE_NONE, ( gobject.TYPE_PYOBJECT, )),
+		"state-changed"	: ( gobject.SIGNAL_ACTION, gobject.TYPE_NONE, ( gobject.TYPE_STRING, gobject.TYPE_PYOBJECT )),
+	}
+
+	def __init__(self):
+		gobject.GObject.__init__(self)
+
+		self.state		= STATE_STOPPED
+
+		self.meta		= {
+			"name"			: None,
+			"description"		: None,
+			"website"		: None,
+			"playing"		: None,
+			"format"		: None,
+			"bitrate"		: None,
+			"codec"			: None,
+		}
+
+		self.busid		= None
+		self.connectstart	= None
+		self.writer		= None
+		self.maxlatency		= 30
+		self.minlatency		= 2
+		self.pipeline		= None
+		self.pool		= PipelinePool()
+		self.timeshift		= 1800
+		self.volume		= 1.0
+
+		# reconnect attempts and backoff delays in seconds
+		self.gapstart		= None
+		self.gaptime		= 0
+		self.reconnectdelay	= 1.0
+		self.reconnectmax	= 10
+		self.reconnectmaxdelay	= 60.0
+		self.reconnects		= 0
+		self.reconnecttimer	= None
+		self.retries		= 0
+		self.uris		= []
+
+		# number of streams to connect to in parallel, and
+		# the delay in ms between starting each of them
+		self.race		= {}
+		self.racenext		= 0
+		self.racesize		= 3
+		self.racestagger	= 250
+		self.racetimers		= {}
+		self.raceuris		= []
+
+		self.__set_pipeline(self.__create_pipeline())
+
+
+	def __cb_bus(self, bus, message, data = None):
+		"Callback for bus messages"
+
+		# handle tag lists from any source
+		if message.type == gst.MESSAGE_TAG:
+			return self.__cb_bus_taglist(message)
+
+		# handle errors from any source
+		elif message.type == gst.MESSAGE_ERROR:
+			return self.__cb_bus_error(message)
+
+		# skip messages not from pipeline
+		elif message.src != self.pipeline:
+			return True
+
+		# skip clock messages
+		elif message.type in ( gst.MESSAGE_CLOCK_PROVIDE, gst.MESSAGE_CLOCK_LOST, gst.MESSAGE_NEW_CLOCK ):
+			return True
+
+		# handle state changes
+		elif message.type == gst.MESSAGE_STATE_CHANGED:
+			return self.__cb_bus_state_changed(message)
+
+		# handle buffering
+		elif message.type == gst.MESSAGE_BUFFERING:
+			return self.__cb_bus_buffering(message)
+
+		# handle end-of-stream
+		elif message.type == gst.MESSAGE_EOS:
+			return self.__cb_bus_eos(message)
+
+		# warn about unhandled messages
+		else:
+			print "Unhandled gst message:", message, "of type", message.type
+
+		return True
+
+
+	def __cb_bus_buffering(self, message):
+		"Callback for bus buffering messages"
+
+		bufferfill = message.structure["buffer-fill"]
+
+		# the queue refills while paused, without affecting playback
+		if self.state == STATE_PAUSED:
+			return True
+
+		# a reconnected source doesn't change the pipeline state,
+		# so playback resumes once the buffer is filled. the sink
+		# clock kept running through the gap, so its running time
+		# is restarted, or the late audio would be skipped
+		if bufferfill == 1 and self.gapstart != None and self.reconnecttimer == None:
+			try:
+				self.pipeline.resync()
+
+			except PlayError:
+				pass
+
+			self.__set_state(STATE_PLAYING, self.__get_connectinfo())
+			return True
+
+		if bufferfill == 1 or self.state == STATE_PLAYING:
 			return True
 
 		self.__set_state(STATE_BUFFERING, bufferfill)
@@ -426,6 +1260,9 @@ class Player(gobject.GObject):
 	def __cb_bus_eos(self, message):
 		"Callback for bus end-of-stream messages"
 
+		if self.__reconnect() == True:
+			return True
+
 		self.pipeline.set_state(gst.STATE_NULL)
 		self.__set_state(STATE_STOPPED)
 
@@ -435,469 +1272,2580 @@ class Player(gobject.GObject):
 	def __cb_bus_error(self, message):
 		"Callback for error messages"
 
-		self.__set_error(message.structure["error"])
+		if self.__reconnect() == True:
+			return True
+
+		if message.structure.has_key("error"):
+			self.__set_error(message.structure["error"])
+
+		else:
+			error, debug = message.parse_error()
+			self.__set_error(error.message)
+
+		return True
+
+
+	def __cb_bus_state_changed(self, message):
+		"Callback for bus state changed messages"
+
+		newstate = message.structure["new-state"]
+		oldstate = message.structure["old-state"]
+		state	= self.state
+
+		if newstate == gst.STATE_NULL:
+			if self.state not in ( STATE_STOPPED, STATE_ERROR ):
+				state = STATE_STOPPED
+
+		elif newstate in ( gst.STATE_READY, gst.STATE_PAUSED ):
+			pass
+
+		elif newstate == gst.STATE_PLAYING:
+			state = STATE_PLAYING
+
+		else:
+			print "Uncaught state change:", oldstate, newstate
+
+		if state == STATE_PLAYING and self.state != STATE_PLAYING:
+			self.__set_state(state, self.__get_connectinfo())
+
+		else:
+			self.__set_state(state)
+
+		return True
+
+
+	def __cb_reconnect(self, uri):
+		"Callback for reconnecting to a stream"
+
+		self.reconnecttimer	= None
+		self.connectstart	= time.time()
+		self.reconnects		+= 1
+
+		try:
+			self.pipeline.reconnect(uri)
+
+		except PlayError:
+
+			# fall back to restarting the whole pipeline
+			try:
+				self.pipeline.play(uri)
+
+			except PlayError:
+				if self.__reconnect() == False:
+					self.__set_error("Unable to reconnect to stream")
+
+		return False
+
+
+	def __cb_race_bus(self, bus, message, pipeline):
+		"Callback for bus messages from racing pipelines"
+
+		if message.type == gst.MESSAGE_TAG:
+			pipeline.add_tags(dict(message.structure))
+
+		elif message.type in ( gst.MESSAGE_EOS, gst.MESSAGE_ERROR ):
+			self.__race_drop(pipeline)
+
+		# the pipeline is paused when decoded audio reaches the sink
+		elif message.type == gst.MESSAGE_STATE_CHANGED and message.src == pipeline:
+			if message.structure["new-state"] == gst.STATE_PAUSED:
+				self.__race_finish(pipeline)
+
+		return True
+
+
+	def __cb_race_start(self, index, uri):
+		"Callback for starting a racing pipeline"
+
+		del self.racetimers[index]
+
+		pipeline = self.__create_pipeline()
+		self.race[pipeline] = pipeline.bus.add_watch(self.__cb_race_bus, pipeline)
+
+		try:
+			pipeline.prepare(uri)
+
+		except PlayError:
+			self.__race_drop(pipeline)
+
+		return False
+
+
+	def __cb_bus_taglist(self, message):
+		"Callback for tag lists"
+
+		taglist = dict(message.structure)
+		self.pipeline.add_tags(taglist)
+
+		return self.__set_taglist(taglist)
+
+
+	def __clear_meta(self):
+		"Clears the metadata"
+
+		for key in self.meta.keys():
+			self.meta[key] = None
+
+		self.emit("meta-changed", self.meta)
+
+
+	def __create_pipeline(self):
+		"Creates a new pipeline"
+
+		pipeline = Pipeline(self.timeshift)
+		pipeline.set_latency(self.minlatency, self.maxlatency)
+
+		return pipeline
+
+
+	def __get_connectinfo(self):
+		"Returns info about the last connection"
+
+		info = {
+			"uri"		: self.pipeline.uri,
+			"reconnects"	: self.reconnects,
+		}
+
+		if self.connectstart != None:
+			info["connect-time"]	= time.time() - self.connectstart
+			self.connectstart	= None
+
+		if self.gapstart != None:
+			info["gap"]		= time.time() - self.gapstart
+			self.gaptime		+= info["gap"]
+			self.gapstart		= None
+			self.retries		= 0
+
+		return info
+
+
+	def __race(self, uris):
+		"Connects to several uris in parallel, and plays the first one to deliver audio"
+
+		self.__set_state(STATE_CONNECTING, uris[0])
+
+		self.racenext	= 0
+		self.raceuris	= list(uris)
+
+		for index in range(min(len(uris), self.racesize)):
+			self.__race_next(index * self.racestagger)
+
+
+	def __race_cancel(self):
+		"Cancels a running race"
+
+		for timer in self.racetimers.values():
+			gobject.source_remove(timer)
+
+		for pipeline, watch in self.race.items():
+			gobject.source_remove(watch)
+			pipeline.stop()
+
+		self.race	= {}
+		self.racenext	= 0
+		self.racetimers	= {}
+		self.raceuris	= []
+
+
+	def __race_drop(self, pipeline):
+		"Drops a pipeline from a race"
+
+		if not self.race.has_key(pipeline):
+			return
+
+		gobject.source_remove(self.race[pipeline])
+		del self.race[pipeline]
+
+		pipeline.stop()
+
+		if self.state != STATE_CONNECTING:
+			return
+
+		# take the place of the dropped stream with one not tried yet
+		elif self.__race_next() == True:
+			return
+
+		elif len(self.race) == 0 and len(self.racetimers) == 0:
+			self.__set_error("Unable to play stream")
+
+
+	def __race_finish(self, pipeline):
+		"Plays the winner of a race, and cancels the rest"
+
+		gobject.source_remove(self.race[pipeline])
+		del self.race[pipeline]
+
+		self.__race_cancel()
+
+		self.pipeline.stop()
+		self.__set_pipeline(pipeline)
+		self.__set_taglist(pipeline.tags)
+
+		try:
+			self.pipeline.activate()
+
+		except PlayError:
+			self.__set_error("Unable to play stream")
+
+
+	def __race_next(self, delay = 0):
+		"Starts connecting to the next untried uri of a race, if any"
+
+		if self.racenext >= len(self.raceuris):
+			return False
+
+		index		= self.racenext
+		self.racenext	+= 1
+
+		self.racetimers[index] = gobject.timeout_add(delay, self.__cb_race_start, index, self.raceuris[index])
+
+		return True
+
+
+	def __reconnect(self):
+		"Schedules a reconnect to the current station, if possible"
+
+		if self.reconnecttimer != None:
+			return True
+
+		elif len(self.uris) == 0 or self.retries >= self.reconnectmax:
+			return False
+
+		# only reconnect to streams which have been playing
+		elif self.gapstart == None and self.state not in ( STATE_PLAYING, STATE_BUFFERING ):
+			return False
+
+		if self.gapstart == None:
+			self.gapstart = time.time()
+
+		# retry the current stream first, then rotate through the others
+		if self.pipeline.uri in self.uris:
+			index = self.uris.index(self.pipeline.uri) + min(self.retries, 1)
+
+		else:
+			index = 0
+
+		uri	= self.uris[index % len(self.uris)]
+		delay	= util.backoff(self.retries, self.reconnectdelay, self.reconnectmaxdelay)
+
+		self.retries		+= 1
+		self.reconnecttimer	= gobject.timeout_add(int(delay * 1000), self.__cb_reconnect, uri)
+
+		self.__set_state(STATE_CONNECTING, uri)
+
+		return True
+
+
+	def __set_error(self, error):
+		"Sets an error state"
+
+		self.stop()
+		self.__set_state(STATE_ERROR, error)
+
+
+	def __set_meta(self, meta):
+		"Sets meta data"
+
+		changed = False
+
+		for key, value in meta.items():
+			if self.meta.has_key(key) == False:
+				continue
+
+			elif self.meta[key] == value:
+				continue
+
+			self.meta[key] = value
+			changed = True
+
+		if changed == True:
+			self.emit("meta-changed", self.meta)
+			pass
+
+
+	def __set_pipeline(self, pipeline):
+		"Sets the active pipeline"
+
+		if self.busid != None:
+			gobject.source_remove(self.busid)
+
+		self.pipeline	= pipeline
+		self.busid	= pipeline.bus.add_watch(self.__cb_bus)
+
+		self.pipeline.set_volume(self.volume)
+
+
+	def __set_state(self, state, data = None):
+		"Sets the current state"
+
+		if self.state == state and data == None:
+			return
+
+		self.state = state
+		self.emit("state-changed", state, data)
+
+
+	def __set_taglist(self, taglist):
+		"Sets metadata from a tag list"
+
+		meta = {}
+
+		# name
+		if taglist.has_key("iradio-name"):
+			meta["name"] = taglist["iradio-name"]
+
+		# description
+		if taglist.has_key("iradio-genre"):
+			meta["description"] = taglist["iradio-genre"]
+
+		# website
+		if taglist.has_key("iradio-url"):
+			meta["website"] = taglist["iradio-url"]
+
+		# playing
+		if taglist.has_key("iradio-title"):
+			meta["playing"] = taglist["iradio-title"]
+
+		elif taglist.has_key("artist") and taglist.has_key("title"):
+			meta["playing"] = taglist["artist"] + " - " + taglist["title"]
+
+			if taglist["title"] == "" and meta["playing"][-3:] == " - ":
+				meta["playing"] = meta["playing"][:-3]
+
+		# format
+		if taglist.has_key("audio-codec"):
+			meta["format"] = taglist["audio-codec"]
+
+		if meta.get("format") == "MPEG" and taglist.has_key("layer"):
+			meta["format"] += " layer " + str(taglist["layer"])
+
+		# bitrate
+		if taglist.has_key("nominal-bitrate"):
+			meta["bitrate"] = int(taglist["nominal-bitrate"] / 1000)
+
+		elif taglist.has_key("bitrate"):
+			meta["bitrate"] = int(taglist["bitrate"] / 1000)
+
+		# codec data
+		meta["codec"]	= taglist
+
+		self.__set_meta(meta)
+
+		return True
+
+
+	def get_duration(self):
+		"Gets the current pipeline duration"
+
+		return self.pipeline.get_duration()
+
+
+	def get_position(self):
+		"Gets the current pipeline position"
+
+		return self.pipeline.get_position()
+
+
+	def get_reconnects(self):
+		"Returns the number of reconnects and the seconds without audio, for the current stream"
+
+		gaptime = self.gaptime
+
+		if self.gapstart != None:
+			gaptime += time.time() - self.gapstart
+
+		return self.reconnects, gaptime
+
+
+	def get_volume(self):
+		"Gets the current pipeline volume"
+
+		return self.volume
+
+
+	def is_recording(self):
+		"Checks if the player is recording"
+
+		return self.pipeline.recorder != None
+
+
+	def live(self):
+		"Moves playback back to the live stream"
+
+		if self.state not in ( STATE_PLAYING, STATE_PAUSED ):
+			raise PlayError
+
+		self.pipeline.live()
+
+
+	def pause(self):
+		"Pauses playback, while the stream is still received"
+
+		if self.state != STATE_PLAYING:
+			raise PlayError
+
+		self.pipeline.pause()
+		self.__set_state(STATE_PAUSED)
+
+
+	def play(self, uris):
+		"Plays a list of uris"
+
+		self.stop_recording()
+
+		# keep the current stream connected, for fast switching back
+		if self.state in ( STATE_PLAYING, STATE_BUFFERING ) and self.pool.size > 0:
+			try:
+				self.pipeline.standby()
+				self.pool.add(self.pipeline)
+
+			except PlayError:
+				self.pipeline.stop()
+
+			self.__set_pipeline(self.__create_pipeline())
+			self.__set_state(STATE_STOPPED)
+
+		else:
+			self.stop()
+
+		self.__clear_meta()
+
+		if uris == None or len(uris) == 0:
+			self.__set_error("No streams found")
+			return False
+
+		self.connectstart	= time.time()
+		self.reconnects		= 0
+		self.gaptime		= 0
+		self.uris		= list(uris)
+
+		# switch to a standby pipeline if available
+		pipeline = self.pool.find(uris)
+
+		if pipeline != None:
+			self.pool.take(pipeline)
+			self.pipeline.stop()
+
+			self.__set_state(STATE_CONNECTING, pipeline.uri)
+			self.__set_pipeline(pipeline)
+			self.__set_taglist(pipeline.tags)
+
+			try:
+				self.pipeline.activate()
+
+				return True
+
+			except PlayError:
+				self.pipeline.stop()
+
+		# connect to several streams at once, if possible
+		if self.racesize > 1 and len(uris) > 1:
+			self.__race(uris)
+
+			return True
+
+		for uri in uris:
+			try:
+				self.__set_state(STATE_CONNECTING, uri)
+				self.pipeline.play(uri)
+
+				return True
+
+			except PlayError:
+				continue
+
+		else:
+			self.__set_error("Unable to play stream")
+
+		return False
+
+
+	def prepare(self, uris):
+		"Connects to a list of uris in the background, for instant playback"
+
+		if uris == None or len(uris) == 0 or self.pool.size < 1:
+			return False
+
+		if self.state != STATE_STOPPED and self.pipeline.uri in uris:
+			return True
+
+		if self.pool.find(uris) != None:
+			return True
+
+		pipeline = self.__create_pipeline()
+
+		try:
+			pipeline.prepare(uris[0])
+
+		except PlayError:
+			pipeline.stop()
+			return False
+
+		self.pool.add(pipeline)
+
+		return True
+
+
+	def record(self, file, split = False, preroll = 0, postroll = 0):
+		"Records the current stream to a file, optionally one file per track"
+
+		if self.state not in ( STATE_PLAYING, STATE_BUFFERING, STATE_PAUSED ):
+			raise PlayError
+
+		if self.writer == None:
+			self.writer = RecordWriter()
+
+		self.pipeline.record(file, self.writer, split, preroll, postroll)
+
+
+	def resume(self):
+		"Resumes paused playback, from where it was paused"
+
+		if self.state != STATE_PAUSED:
+			raise PlayError
+
+		# the pipeline state change sets the playing state
+		self.pipeline.activate()
+
+
+	def rewind(self, seconds):
+		"Moves playback back in time, within the timeshift window"
+
+		if self.state not in ( STATE_PLAYING, STATE_PAUSED ):
+			raise PlayError
+
+		self.pipeline.rewind(seconds)
+
+
+	def set_latency(self, minlatency, maxlatency):
+		"Sets the minimum and maximum buffer latency, in seconds"
+
+		self.minlatency = minlatency
+		self.maxlatency = maxlatency
+
+		for pipeline in [ self.pipeline ] + self.pool.pipelines:
+			pipeline.set_latency(minlatency, maxlatency)
+
+
+	def set_timeshift(self, timeshift):
+		"Sets the length of the timeshift window, in seconds"
+
+		self.timeshift = timeshift
+
+		for pipeline in [ self.pipeline ] + self.pool.pipelines:
+			pipeline.set_timeshift(timeshift)
+
+
+	def set_volume(self, volume):
+		"Sets the pipeline volume"
+
+		self.volume = max(min(volume, 1), 0)
+
+		return self.pipeline.set_volume(volume)
+
+
+	def stop(self):
+		"Stops the player"
+
+		self.__race_cancel()
+
+		if self.reconnecttimer != None:
+			gobject.source_remove(self.reconnecttimer)
+			self.reconnecttimer = None
+
+		self.gapstart	= None
+		self.retries	= 0
+
+		if self.state == STATE_STOPPED:
+			return
+
+		self.pipeline.stop()
+
+		self.__set_state(STATE_STOPPED)
+
+
+	def stop_recording(self):
+		"Stops recording"
+
+		self.pipeline.stop_recording()
+
+
+
+class Playlist(gobject.GObject):
+	"A playlist"
+
+	def __init__(self, data = None):
+		gobject.GObject.__init__(self)
+
+		self.list	= []
+
+		if data != None:
+			self.import_data(data)
+
+
+	def add_files(self, files):
+		"Adds a list of files to the playlist"
+
+		for file in files:
+			self.list.append(file)
+
+
+	def clear(self):
+		"Clears the playlist"
+
+		self.list = []
+
+
+	def export_pls(self):
+		"Saves the playlist to a file"
+
+		data = StringIO.StringIO()
+		self.write_pls(data)
+
+		return data.getvalue()
+
+
+	def get_files(self):
+		"Returns a list of the files in the playlist"
+
+		return self.list
+
+
+	def import_asx(self, data):
+		"Reads data from an ASX playlist"
+
+		try:
+			dom = xml.dom.minidom.parseString(data.strip())
+
+			if dom.documentElement.nodeName.lower() != "asx":
+				raise DataError
+
+			refnodes = [ node for node in dom.documentElement.getElementsByTagName("*") if node.nodeName.lower() == "ref" ]
+
+			for node in refnodes:
+				for i in range(node.attributes.length):
+					attr = node.attributes.item(i)
+
+					if attr.name.lower() == "href" and attr.value.strip() != "":
+						self.list.append(attr.value.strip())
+
+		except ExpatError:
+			raise DataError
+
+
+	def import_data(self, data):
+		"Reads data from a playlist"
+
+		if data.strip()[:10] == "[playlist]":
+			self.import_pls(data)
+
+		elif "<asx" in data.lower():
+			self.import_asx(data)
+
+		else:
+			self.import_m3u(data)
+
+		if len(self.get_files()) == 0:
+			raise DataError
+
+
+	def import_m3u(self, data):
+		"Reads data from an M3U playlist"
+
+		for item in data.splitlines():
+			item = item.strip()
+
+			if item == "":
+				continue
+
+			elif item[0] == "#":
+				continue
+
+			elif not re.match("^[a-z]+://\S+$", item, re.IGNORECASE):
+				continue
+
+			self.list.append(item)
+
+
+	def import_pls(self, data):
+		"Reads data from a PLS playlist"
+
+		items = {}
+
+		for item in data.splitlines():
+
+			if "=" not in item:
+				continue
+
+			key, value = item.split("=", 1)
+			key = key.strip().lower()
+			value = value.strip()
+
+			m = re.match("file(\d+)", key)
+
+			if m == None:
+				continue
+
+			items[int(m.group(1))] = value
+
+
+		# handle items
+		keys = items.keys()
+		keys.sort()
+
+		for index in keys:
+			self.list.append(items[index])
+
+
+	def write_pls(self, file):
+		"Writes the playlist as PLS to a file object"
+
+		file.write("[playlist]\n")
+		file.write("NumberOfEntries=%i\n" % len(self.list))
+
+		index = 0
+
+		for item in self.list:
+			index += 1
+			file.write("File%i=%s\n" % (index, item))
+
+
+
+class Recorder(gst.Bin):
+	"A bin recording a compressed stream to a file, optionally split by track"
+
+	def __init__(self, file, writer, split = False, preroll = 0, postroll = 0):
+		gst.Bin.__init__(self)
+
+		if preroll < 0 or postroll < 0:
+			raise ValueError("pre- and post-roll can't be negative")
+
+		self.bitrate	= 128000
+		self.bytes	= 0
+		self.error	= None
+		self.file	= file
+		self.handle	= None
+		self.mimetype	= None
+		self.received	= 0
+		self.title	= None
+		self.writer	= writer
+
+		# track splitting, with pre- and post-roll in seconds
+		self.closing	= []
+		self.history	= []
+		self.historysize	= 0
+		self.postroll	= postroll
+		self.preroll	= preroll
+		self.split	= split
+
+		# detect the stream type, to find frame boundaries
+		self.typefind = gst.element_factory_make("typefind", "typefind")
+		self.typefind.connect("have-type", self.__cb_typefind)
+		self.add(self.typefind)
+
+		# hand buffers to the writer thread, so that file writes
+		# never block the streaming thread
+		self.sink = gst.element_factory_make("fakesink", "sink")
+		self.sink.set_property("signal-handoffs", True)
+		self.sink.set_property("sync", False)
+		self.sink.connect("handoff", self.__cb_handoff)
+		self.add(self.sink)
+
+		self.typefind.link(self.sink)
+		self.add_pad(gst.GhostPad("sink", self.typefind.get_pad("sink")))
+
+
+	def __cb_handoff(self, sink, buffer, pad):
+		"Callback for recorded buffers"
+
+		self.received += len(buffer.data)
+		self.writer.put(self.__write, buffer.data)
+
+
+	def __cb_typefind(self, typefind, probability, caps):
+		"Callback for detected stream types"
+
+		structure = caps[0]
+		self.mimetype = structure.get_name()
+
+		# mpeg-2/4 audio is aac in adts frames
+		if self.mimetype == "audio/mpeg" and structure.has_key("mpegversion") and structure["mpegversion"] != 1:
+			self.mimetype = "audio/x-aac"
+
+
+	def __close(self):
+		"Closes the recording, from the writer thread"
+
+		for handle, remaining, held in self.closing:
+			handle.write(held)
+			handle.close()
+
+		self.closing = []
+
+		if self.handle != None:
+			self.handle.close()
+			self.handle = None
+
+		self.file = None
+
+
+	def __find_frame(self, data, offset = 0):
+		"Returns the offset of the first frame header in data, or -1"
+
+		if offset >= len(data):
+			return -1
+
+		elif self.mimetype == "application/ogg":
+			return data.find("OggS", offset)
+
+		# streams without known framing can be cut anywhere
+		elif self.mimetype not in ( "audio/mpeg", "audio/x-aac" ):
+			return offset
+
+		index = data.find("\xff", offset)
+
+		while index != -1:
+			length = self.__get_frame_length(data, index)
+
+			# a header is only trusted when the next frame follows it,
+			# as the sync pattern is common in the audio data itself
+			if length == None:
+				return -1
+
+			elif length > 0:
+				following = self.__get_frame_length(data, index + length)
+
+				if following == None:
+					return -1
+
+				elif following > 0:
+					return index
+
+			index = data.find("\xff", index + 1)
+
+		return -1
+
+
+	def __get_extension(self):
+		"Returns a file extension for the stream type"
+
+		return {
+			"application/ogg"	: ".ogg",
+			"audio/mpeg"		: ".mp3",
+			"audio/x-aac"		: ".aac",
+		}.get(self.mimetype, "")
+
+
+	def __get_filename(self, title):
+		"Returns an unused filename for a track"
+
+		directory	= os.path.dirname(self.file)
+		base, ext	= os.path.splitext(os.path.basename(self.file))
+
+		if ext == "":
+			ext = self.__get_extension()
+
+		name = re.sub("[/\\\\\0]", "-", title).strip(" .") or base
+		file = os.path.join(directory, name + ext)
+		index = 1
+
+		while os.path.exists(file):
+			index += 1
+			file = os.path.join(directory, "%s (%i)%s" % ( name, index, ext ))
+
+		return file
+
+
+	def __get_frame_length(self, data, index):
+		"Returns the length of a frame with a header at index, 0 if there is none, or None if data ends first"
+
+		if index + 6 >= len(data):
+			return None
+
+		byte1 = ord(data[index + 1])
+		byte2 = ord(data[index + 2])
+
+		if data[index] != "\xff":
+			return 0
+
+		# adts: 12 bit sync, layer 0, and a 13 bit frame length including the header
+		elif self.mimetype == "audio/x-aac":
+			if byte1 & 0xf6 != 0xf0:
+				return 0
+
+			length = (ord(data[index + 3]) & 0x03) << 11 | ord(data[index + 4]) << 3 | ord(data[index + 5]) >> 5
+
+			if length < 7:
+				return 0
+
+			return length
+
+		# mpeg audio: 11 bit sync, valid version and layer, and
+		# a bitrate and sample rate the frame length follows from
+		version		= byte1 >> 3 & 0x03
+		layer		= byte1 >> 1 & 0x03
+		bitrate		= byte2 >> 4
+		samplerate	= byte2 >> 2 & 0x03
+		padding		= byte2 >> 1 & 0x01
+
+		if byte1 & 0xe0 != 0xe0 or version == 1 or layer == 0 or bitrate in ( 0, 15 ) or samplerate == 3:
+			return 0
+
+		bitrate		= MPEG_BITRATES[( version == 3, layer )][bitrate] * 1000
+		samplerate	= MPEG_SAMPLERATES[version][samplerate]
+
+		if layer == 3:
+			return (12 * bitrate / samplerate + padding) * 4
+
+		elif layer == 1 and version != 3:
+			return 72 * bitrate / samplerate + padding
+
+		else:
+			return 144 * bitrate / samplerate + padding
+
+
+	def __get_holdback(self):
+		"Returns the bytes held back from closing files, enough for a frame to be confirmed"
+
+		if self.mimetype in ( "audio/mpeg", "audio/x-aac" ):
+			return 8192 + 7
+
+		elif self.mimetype == "application/ogg":
+			return 3
+
+		return 0
+
+
+	def __open(self, file):
+		"Sets the file to write to, from the writer thread"
+
+		self.__close()
+		self.file = file
+
+
+	def __split(self, title):
+		"Starts a new file for a track, from the writer thread"
+
+		if self.error != None or self.file == None:
+			return
+
+		# keep writing the old file for the post-roll
+		if self.handle != None:
+			self.closing.append([ self.handle, int(self.postroll * self.bitrate / 8), "" ])
+			self.handle = None
+
+		try:
+			self.handle = open(self.__get_filename(title), "wb")
+
+		except IOError, error:
+			self.error = error
+			self.__close()
+			return
+
+		# start the new file with the pre-roll, from a frame boundary
+		data	= "".join(self.history)
+		offset	= self.__find_frame(data)
+
+		if offset != -1:
+			self.handle.write(data[offset:])
+			self.bytes += len(data) - offset
+
+
+	def __write(self, data):
+		"Writes data to the file, from the writer thread"
+
+		if self.error != None:
+			return
+
+		try:
+			if self.handle == None and len(self.closing) == 0 and self.file != None:
+				if os.path.splitext(self.file)[1] == "":
+					self.file += self.__get_extension()
+
+				self.handle = open(self.file, "wb")
+
+			# finish files in post-roll at the first frame boundary after
+			# it. the end of the data is held back until the next buffer,
+			# as it may hold a frame which can't be confirmed yet
+			for item in self.closing[:]:
+				handle, remaining, held = item
+				buffer = held + data
+				offset = self.__find_frame(buffer, max(remaining, 0))
+
+				if offset == -1:
+					written = max(len(buffer) - self.__get_holdback(), 0)
+					handle.write(buffer[:written])
+					item[1] -= written
+					item[2] = buffer[written:]
+
+				else:
+					handle.write(buffer[:offset])
+					handle.close()
+					self.closing.remove(item)
+
+			if self.handle != None:
+				self.handle.write(data)
+				self.bytes += len(data)
+
+		except IOError, error:
+			self.error = error
+			self.__close()
+			return
+
+		# keep the most recent data for the pre-roll of the next track
+		if self.split == True:
+			self.history.append(data)
+			self.historysize += len(data)
+
+			preroll = int(self.preroll * self.bitrate / 8)
+
+			while len(self.history) > 1 and self.historysize - len(self.history[0]) >= preroll:
+				self.historysize -= len(self.history.pop(0))
+
+
+	def close(self):
+		"Closes the recording, once pending data is written"
+
+		self.writer.put(self.__close)
+
+
+	def open(self, file):
+		"Starts writing to a file, closing any earlier one"
+
+		self.writer.put(self.__open, file, True)
+
+
+	def set_title(self, title):
+		"Sets the current track title, which starts a new file when splitting"
+
+		if title in ( None, "" ) or title == self.title:
+			return
+
+		first		= self.title == None
+		self.title	= title
+
+		# the recording is already in progress when the first title arrives
+		if self.split == True and first == False:
+			self.writer.put(self.__split, title, True)
+
+
+
+class RecordWriter(threading.Thread):
+	"A thread for writing recordings to disk"
+
+	def __init__(self, maxbytes = 4 * 1024 * 1024):
+		threading.Thread.__init__(self)
+		self.setDaemon(True)
+
+		self.condition	= threading.Condition()
+		self.dropped	= 0
+		self.items	= []
+		self.maxbytes	= maxbytes
+		self.pending	= 0
+
+		self.start()
+
+
+	def put(self, callback, data = None, control = False):
+		"Queues a callback to be run on the writer thread, with optional data"
+
+		# control commands, like splits, are never dropped
+		size = 0
+
+		if control == False and data != None:
+			size = len(data)
+
+		self.condition.acquire()
+
+		try:
+			# drop data rather than grow without bounds if the disk is slow
+			if size > 0 and self.pending + size > self.maxbytes:
+				self.dropped += size
+				return
+
+			self.pending += size
+			self.items.append(( callback, data, size ))
+			self.condition.notify()
+
+		finally:
+			self.condition.release()
+
+
+	def run(self):
+		"Runs the writer thread"
+
+		while 1:
+			self.condition.acquire()
+
+			while len(self.items) == 0:
+				self.condition.wait()
+
+			items		= self.items
+			self.items	= []
+
+			self.condition.release()
+
+			for callback, data, size in items:
+				# a failing recording mustn't stop the others from being written
+				try:
+					if data == None:
+						callback()
+
+					else:
+						callback(data)
+
+				except:
+					sys.stderr.write(util.trace_exception(*sys.exc_info()))
+
+				if size > 0:
+					self.condition.acquire()
+					self.pending -= size
+					self.condition.release()
+
+
+	def sync(self):
+		"Waits until all queued data has been written"
+
+		done = threading.Event()
+		self.put(done.set)
+		done.wait()
+
+
+
+class RingBuffer:
+	"A fixed-size ring of stream data, in a memory-mapped temporary file"
+
+	def __init__(self, size):
+		self.condition	= threading.Condition()
+		self.eos	= False
+		self.interrupts	= 0
+		self.size	= size
+
+		# stream offsets of the current stream and the end of the data
+		self.end	= 0
+		self.start	= 0
+
+		# the file keeps memory use constant, the kernel pages it as needed
+		self.file	= tempfile.TemporaryFile()
+		self.file.truncate(size)
+		self.map	= mmap.mmap(self.file.fileno(), size)
+
+
+	def close(self):
+		"Closes the ring buffer"
+
+		self.map.close()
+		self.file.close()
+
+
+	def get_window(self):
+		"Returns the start and end offsets of the data in the buffer"
+
+		self.condition.acquire()
+		window = ( max(self.start, self.end - self.size), self.end )
+		self.condition.release()
+
+		return window
+
+
+	def interrupt(self):
+		"Wakes up a blocked reader"
+
+		self.condition.acquire()
+		self.interrupts += 1
+		self.condition.notifyAll()
+		self.condition.release()
+
+
+	def read(self, offset, length):
+		"Reads data from an offset as ( offset, data ), blocking until available"
+
+		self.condition.acquire()
+
+		try:
+			interrupts = self.interrupts
+
+			while offset >= self.end and self.eos == False and interrupts == self.interrupts:
+				self.condition.wait()
+
+			if interrupts != self.interrupts:
+				return None
+
+			elif offset >= self.end:
+				return offset, ""
+
+			# data which has been overwritten is skipped
+			offset	= max(offset, self.start, self.end - self.size)
+			length	= min(length, self.end - offset)
+			index	= offset % self.size
+
+			if index + length <= self.size:
+				data = self.map[index:index + length]
+
+			else:
+				data = self.map[index:] + self.map[:index + length - self.size]
+
+			return offset, data
+
+		finally:
+			self.condition.release()
+
+
+	def resize(self, size):
+		"Changes the size of the buffer, keeping the most recent data"
+
+		self.condition.acquire()
+
+		try:
+			start, end	= self.get_window()
+			start		= max(start, end - size)
+			data		= ""
+
+			if end > start:
+				offset, data = self.read(start, end - start)
+
+			self.map.close()
+			self.file.close()
+
+			self.size	= size
+			self.file	= tempfile.TemporaryFile()
+			self.file.truncate(size)
+			self.map	= mmap.mmap(self.file.fileno(), size)
+
+			# rewrite the data at its offsets in the new size,
+			# and drop whatever didn't fit from the window
+			self.end	= start
+			self.start	= max(self.start, start)
+			self.write(data)
+
+		finally:
+			self.condition.release()
+
+
+	def reset(self):
+		"Starts a new stream, at the end of the data"
+
+		self.condition.acquire()
+		self.eos	= False
+		self.start	= self.end
+		self.condition.notifyAll()
+		self.condition.release()
+
+
+	def set_eos(self, eos):
+		"Marks the end of the stream"
+
+		self.condition.acquire()
+		self.eos = eos
+		self.condition.notifyAll()
+		self.condition.release()
+
+
+	def write(self, data):
+		"Writes data at the end of the buffer, overwriting the oldest data"
+
+		self.condition.acquire()
+
+		if len(data) > self.size:
+			self.end	+= len(data) - self.size
+			data		= data[-self.size:]
+
+		index	= self.end % self.size
+		first	= min(len(data), self.size - index)
+
+		self.map[index:index + first] = data[:first]
+		self.map[:len(data) - first] = data[first:]
+
+		self.end += len(data)
+		self.condition.notifyAll()
+		self.condition.release()
+
+
+
+class RingSource(gst.BaseSrc):
+	"A source element playing a ring buffer from a read cursor"
+
+	__gsttemplates__ = (
+		gst.PadTemplate("src", gst.PAD_SRC, gst.PAD_ALWAYS, gst.caps_new_any()),
+	)
+
+	def __init__(self, ring):
+		gst.BaseSrc.__init__(self)
+		self.set_format(gst.FORMAT_BYTES)
+
+		self.cursor	= 0
+		self.eos	= False
+		self.expected	= -1
+		self.ring	= ring
+
+
+	def do_create(self, offset, length):
+		"Creates a buffer from the read cursor"
+
+		# basesrc offsets only follow seeks, as the cursor
+		# skips data which has been overwritten
+		if offset != self.expected:
+			self.cursor = offset
+
+		result = self.ring.read(self.cursor, length)
+
+		if result == None:
+			return gst.FLOW_WRONG_STATE, None
+
+		start, data = result
+
+		if len(data) == 0:
+			self.eos = True
+			return gst.FLOW_UNEXPECTED, None
+
+		buffer = gst.Buffer(data)
+		buffer.offset = start
+
+		if start != self.cursor:
+			buffer.flag_set(gst.BUFFER_FLAG_DISCONT)
+
+		self.cursor	= start + len(data)
+		self.expected	= offset + len(data)
+
+		return gst.FLOW_OK, buffer
+
+
+	def do_is_seekable(self):
+		"Returns whether the source can seek"
+
+		return True
+
+
+	def do_start(self):
+		"Starts reading from the ring buffer, at the read cursor"
+
+		# basesrc starts at offset 0, which mustn't move the cursor
+		self.eos	= False
+		self.expected	= 0
+
+		return True
+
+
+	def do_unlock(self):
+		"Interrupts a blocked read"
+
+		self.ring.interrupt()
+
+		return True
+
+
+	def seek_cursor(self, offset):
+		"Moves the read cursor, flushing data downstream"
+
+		self.eos = False
+		self.seek_simple(gst.FORMAT_BYTES, gst.SEEK_FLAG_FLUSH, offset)
+
+gobject.type_register(RingSource)
+
+
+
+class Station(object):
+	"Info about a station"
+
+	# catalogs can hold tens of thousands of stations, so these are
+	# plain records without an instance dictionary
+	__slots__ = ( "description", "metaupdate", "name", "streams", "version", "website" )
+
+	def __init__(self, name = "", description = "", website = "", streams = ()):
+		self.name		= name
+		self.description	= description
+		self.website		= website
+		self.streams		= streams
+		self.metaupdate		= True
+		self.version		= 0
+
+
+	def __setattr__(self, name, value):
+		"Sets a field, sharing repeated strings and storing streams as a tuple"
+
+		if name == "streams":
+			value = tuple(value or ())
+
+		elif type(value) == str:
+			value = intern(value)
+
+		object.__setattr__(self, name, value)
+
+		# field changes are counted, so that renderings can be reused until one
+		if name not in ( "metaupdate", "version" ):
+			object.__setattr__(self, "version", getattr(self, "version", 0) + 1)
+
+
+
+class StationIndex:
+	"A trigram index of station names, descriptions and websites, for searching"
+
+	def __init__(self):
+		self.grams	= {}
+		self.postings	= 0
+		self.stale	= 0
+		self.texts	= {}
+
+
+	def __get_grams(self, text):
+		"Returns the distinct trigrams of a text"
+
+		grams = {}
+
+		for i in range(len(text) - 2):
+			grams[text[i:i + 3]] = None
+
+		return grams.keys()
+
+
+	def __get_text(self, station):
+		"Returns the searchable text of a station"
+
+		text = "\n".join(( station.name, station.description, station.website ))
+
+		return self.__normalize(text)
+
+
+	def __normalize(self, text):
+		"Lower-cases a text, treating it as utf-8"
+
+		return unicode(text, "utf-8", "replace").lower().encode("utf-8")
+
+
+	def __rebuild(self):
+		"Rebuilds the trigram lists, dropping entries of removed stations"
+
+		self.grams	= {}
+		self.postings	= 0
+		self.stale	= 0
+
+		for key, text in self.texts.items():
+			self.__post(key, text)
+
+
+	def __post(self, key, text):
+		"Adds a key to the lists of the trigrams in a text"
+
+		for gram in self.__get_grams(text):
+			self.grams.setdefault(gram, []).append(key)
+			self.postings += 1
+
+
+	def add(self, key, station):
+		"Adds a station to the index, under a key"
+
+		if self.texts.has_key(key) == True:
+			self.remove(key)
+
+		text = self.__get_text(station)
+
+		self.texts[key] = text
+		self.__post(key, text)
+
+
+	def match(self, key, text):
+		"Returns True if the station under a key matches a search text"
+
+		return self.texts.has_key(key) == True and self.__normalize(text) in self.texts[key]
+
+
+	def remove(self, key):
+		"Removes the station under a key from the index"
+
+		if self.texts.has_key(key) == False:
+			return
+
+		# trigram lists keep the key until rebuilt, as every
+		# candidate is checked against the stored text anyway
+		self.stale += len(self.__get_grams(self.texts[key]))
+		del self.texts[key]
+
+		if self.stale > self.postings / 2:
+			self.__rebuild()
+
+
+	def search(self, text, within = None):
+		"Returns a dictionary of the keys of stations containing a text, or None if all match"
+
+		text = self.__normalize(text)
+
+		if text == "":
+			return None
+
+		# short texts have no trigrams to look up
+		if len(text) < 3:
+			candidates = self.texts.keys()
+
+		else:
+			candidates = None
+
+			for gram in self.__get_grams(text):
+				keys = self.grams.get(gram, [])
+
+				if candidates == None or len(keys) < len(candidates):
+					candidates = keys
+
+		# an earlier result for part of the text limits the candidates further
+		if within != None and len(within) < len(candidates):
+			candidates = within.keys()
+
+		matches = {}
+
+		for key in candidates:
+			if self.texts.has_key(key) == True and text in self.texts[key]:
+				matches[key] = None
+
+		return matches
+
+
+
+class StationList(gobject.GObject):
+	"A station list"
+
+	__gsignals__ = {
+		"changed"		: ( gobject.SIGNAL_ACTION, None, () ),
+		"stations-changed"	: ( gobject.SIGNAL_ACTION, None, ( gobject.TYPE_PYOBJECT, )),
+	}
+
+	def __init__(self):
+		gobject.GObject.__init__(self)
+
+		self.changes	= []
+		self.depth	= 0
+		self.journal	= None
+		self.stations	= []
+
+
+	def add_station(self, station):
+		"Adds a station to the list"
+
+		self.begin()
+
+		station.metaupdate = False
+		self.stations.append(station)
+
+		self.record_change(CHANGE_ADD, len(self.stations) - 1, station)
+		self.commit()
+
+
+	def add_stations(self, stations):
+		"Adds several stations to the list, in a single transaction"
+
+		self.begin()
+
+		try:
+			for station in stations:
+				self.add_station(station)
+
+		except:
+			self.rollback()
+			raise
+
+		self.commit()
+
+
+	def begin(self):
+		"Starts a transaction, whose changes are reported once committed"
+
+		# transactions nest, and only the outermost one is committed
+		self.depth += 1
+
+
+	def commit(self):
+		"Commits a transaction, notifying listeners of its changes"
+
+		if self.depth == 0:
+			return
+
+		self.depth -= 1
+
+		if self.depth > 0 or len(self.changes) == 0:
+			return
+
+		changes		= self.changes
+		self.changes	= []
+
+		# the changes are made already, so listeners are notified
+		# even if they couldn't be journaled
+		if self.journal != None:
+			try:
+				self.journal.write(changes)
+
+			except ( IOError, OSError ), error:
+				sys.stderr.write("Unable to write station list journal: %s\n" % error)
+
+		# listeners get a list of ( kind, index, station ) changes, in the
+		# order made, with the station as it was at that point (None
+		# for removals), since later changes may have moved it since
+		self.emit("stations-changed", [ ( kind, index, station ) for kind, index, station, previous in changes ])
+		self.emit("changed")
+
+
+	def export_xml(self):
+		"Saves the station list as XML"
+
+		data = StringIO.StringIO()
+		self.write_xml(data)
+
+		return data.getvalue()
+
+
+	def get_station(self, index):
+		"Fetches a station from the list"
+
+		try:
+			return self.stations[index]
+
+		except IndexError:
+			return None
+
+
+	def get_stations(self):
+		"Returns a list of all stations"
+
+		return self.stations
+
+
+	def import_xml(self, data):
+		"Loads stationlist from XML, given as a string or an iterable of chunks"
+
+		if type(data) in types.StringTypes:
+			data = [ data ]
+
+		parser = StationListParser()
+
+		try:
+			for chunk in data:
+				parser.feed(chunk)
+
+			parser.close()
+
+		except ExpatError:
+			raise DataError
+
+		# stations before invalid data are kept, as long as the XML is well-formed
+		self.add_stations(parser.stations)
+
+		if parser.error == True:
+			raise DataError
+
+
+	def record_change(self, kind, index, station, previous = None):
+		"Records a change made in a transaction, with the station it replaced"
+
+		self.changes.append(( kind, index, station, previous ))
+
+
+	def remove_station(self, index):
+		"Removes a station from the list"
+
+		if index < 0 or index >= len(self.stations):
+			return None
+
+		self.begin()
+
+		station = self.stations.pop(index)
+
+		self.record_change(CHANGE_REMOVE, index, None, station)
+		self.commit()
+
+
+	def remove_stations(self, indices):
+		"Removes the stations at several indices, in a single transaction"
+
+		# removing from the end keeps the remaining indices valid
+		indices = dict([ ( index, None ) for index in indices ]).keys()
+		indices.sort()
+		indices.reverse()
+
+		self.begin()
+
+		try:
+			for index in indices:
+				self.remove_station(index)
+
+		except:
+			self.rollback()
+			raise
+
+		self.commit()
+
+
+	def rollback(self):
+		"Undoes all changes since the outermost transaction began, without notifying listeners"
+
+		changes		= self.changes
+		self.changes	= []
+		self.depth	= 0
+
+		changes.reverse()
+
+		for kind, index, station, previous in changes:
+			if kind == CHANGE_ADD:
+				del self.stations[index]
+
+			elif kind == CHANGE_REMOVE:
+				self.stations.insert(index, previous)
+
+			elif kind == CHANGE_UPDATE:
+				self.stations[index] = previous
+
+
+	def set_journal(self, journal):
+		"Sets a journal to record changes to"
+
+		self.journal = journal
+
+
+	def update_station(self, index, station):
+		"Updates a station"
+
+		if index < 0 or index >= len(self.stations):
+			return None
+
+		self.begin()
+
+		station.metaupdate	= False
+		previous		= self.stations[index]
+		self.stations[index]	= station
+
+		# an updated station never has the version of the one it replaced
+		station.version = max(station.version, previous.version + 1)
+
+		self.record_change(CHANGE_UPDATE, index, station, previous)
+		self.commit()
+
+
+	def write_xml(self, file):
+		"Writes the station list as XML to a file object, one station at a time"
+
+		file.write("<?xml version=\"1.0\" encoding=\"utf-8\" ?>\n")
+		file.write("<stations>\n")
+
+		for station in self.get_stations():
+			data = [
+				"	<station>\n",
+				"		<name>%s</name>\n" % util.escape_markup(station.name),
+				"		<description>%s</description>\n" % util.escape_markup(station.description),
+				"		<website>%s</website>\n" % util.escape_markup(station.website),
+			]
+
+			for stream in station.streams:
+				data.append("		<stream>%s</stream>\n" % util.escape_markup(stream))
+
+			data.append("	</station>\n")
+			file.write("".join(data))
+
+		file.write("</stations>\n")
+
+
+
+class StationListDatabase(StationList):
+	"A station list kept in an indexed SQLite database"
+
+	def __init__(self, file):
+		StationList.__init__(self)
+
+		if sqlite == None:
+			raise DataError("Couldn't find the pysqlite module")
+
+		self.pagesize	= 500
+
+		try:
+			self.db = sqlite.connect(os.path.expanduser(file))
+			self.db.text_factory = str
+			self.__init_schema()
+
+			self.count = self.db.execute("SELECT COUNT(*) FROM stations").fetchone()[0]
+
+		except sqlite.DatabaseError, error:
+			raise DataError(str(error))
+
+
+	def __init_schema(self):
+		"Sets up the database tables and indexes"
+
+		for statement in (
+			"CREATE TABLE IF NOT EXISTS stations (id INTEGER PRIMARY KEY, position INTEGER NOT NULL, name TEXT, description TEXT, website TEXT)",
+			"CREATE TABLE IF NOT EXISTS streams (station INTEGER NOT NULL, position INTEGER NOT NULL, uri TEXT)",
+			"CREATE INDEX IF NOT EXISTS stations_position ON stations (position)",
+			"CREATE INDEX IF NOT EXISTS stations_name ON stations (name)",
+			"CREATE INDEX IF NOT EXISTS stations_description ON stations (description)",
+			"CREATE INDEX IF NOT EXISTS streams_station ON streams (station, position)",
+			"CREATE INDEX IF NOT EXISTS streams_uri ON streams (uri)",
+		):
+			self.db.execute(statement)
+
+		self.db.commit()
+
+
+	def __get_id(self, index):
+		"Returns the database id of a station, or None"
+
+		row = self.db.execute("SELECT id FROM stations WHERE position = ?", ( index, )).fetchone()
+
+		return row and row[0] or None
+
+
+	def __get_stations(self, rows):
+		"Returns stations for database rows of id, name, description and website"
+
+		stations = []
+
+		for id, name, description, website in rows:
+			streams = self.db.execute("SELECT uri FROM streams WHERE station = ? ORDER BY position", ( id, ))
+
+			station			= Station(name or "", description or "", website or "", [ uri for uri, in streams ])
+			station.metaupdate	= False
+
+			stations.append(station)
+
+		return stations
+
+
+	def __set_streams(self, id, station):
+		"Stores the streams of a station"
+
+		self.db.execute("DELETE FROM streams WHERE station = ?", ( id, ))
+
+		for position in range(len(station.streams)):
+			self.db.execute("INSERT INTO streams (station, position, uri) VALUES (?, ?, ?)", ( id, position, station.streams[position] ))
+
+
+	def add_station(self, station):
+		"Adds a station to the list"
+
+		self.begin()
+
+		station.metaupdate = False
+
+		cursor = self.db.execute(
+			"INSERT INTO stations (position, name, description, website) VALUES (?, ?, ?, ?)",
+			( self.count, station.name, station.description, station.website )
+		)
+
+		self.__set_streams(cursor.lastrowid, station)
+		self.count += 1
+
+		self.record_change(CHANGE_ADD, self.count - 1, station)
+		self.commit()
+
+
+	def commit(self):
+		"Commits a transaction to the database, notifying listeners of its changes"
+
+		if self.depth == 1:
+			self.db.commit()
+
+		StationList.commit(self)
+
+
+	def find_stations(self, text, offset = 0, limit = -1):
+		"Returns the indices of stations with a name or description containing a text"
+
+		pattern = "%%%s%%" % text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+		rows = self.db.execute(
+			"SELECT position FROM stations WHERE name LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\' ORDER BY position LIMIT ? OFFSET ?",
+			( pattern, pattern, limit, offset )
+		)
+
+		return [ row[0] for row in rows ]
+
+
+	def find_stream(self, uri):
+		"Returns the index of the station with a stream, or None"
+
+		row = self.db.execute(
+			"SELECT stations.position FROM streams, stations WHERE streams.uri = ? AND stations.id = streams.station ORDER BY stations.position LIMIT 1",
+			( uri, )
+		).fetchone()
+
+		return row and row[0]
+
+
+	def get_count(self):
+		"Returns the number of stations"
+
+		return self.count
+
+
+	def get_page(self, offset, limit):
+		"Returns a list of stations, from an index"
+
+		rows = self.db.execute(
+			"SELECT id, name, description, website FROM stations WHERE position >= ? AND position < ? ORDER BY position",
+			( offset, offset + limit )
+		).fetchall()
+
+		return self.__get_stations(rows)
+
+
+	def get_station(self, index):
+		"Fetches a station from the list"
+
+		if index < 0:
+			return None
+
+		stations = self.get_page(index, 1)
+
+		return stations and stations[0] or None
+
+
+	def get_stations(self):
+		"Returns a sequence of all stations, which reads them as needed"
+
+		return StationListView(self)
+
+
+	def remove_station(self, index):
+		"Removes a station from the list"
+
+		id = self.__get_id(index)
+
+		if id == None:
+			return None
+
+		self.begin()
+
+		self.db.execute("DELETE FROM streams WHERE station = ?", ( id, ))
+		self.db.execute("DELETE FROM stations WHERE id = ?", ( id, ))
+		self.db.execute("UPDATE stations SET position = position - 1 WHERE position > ?", ( index, ))
+		self.count -= 1
+
+		self.record_change(CHANGE_REMOVE, index, None)
+		self.commit()
+
+
+	def rollback(self):
+		"Undoes all changes since the outermost transaction began, without notifying listeners"
+
+		self.db.rollback()
+
+		self.changes	= []
+		self.count	= self.db.execute("SELECT COUNT(*) FROM stations").fetchone()[0]
+		self.depth	= 0
+
+
+	def update_station(self, index, station):
+		"Updates a station"
+
+		id = self.__get_id(index)
+
+		if id == None:
+			return None
+
+		self.begin()
+
+		station.metaupdate = False
+
+		self.db.execute(
+			"UPDATE stations SET name = ?, description = ?, website = ? WHERE id = ?",
+			( station.name, station.description, station.website, id )
+		)
+
+		self.__set_streams(id, station)
+
+		self.record_change(CHANGE_UPDATE, index, station)
+		self.commit()
+
+
+
+class StationListJournal:
+	"An append-only journal of station list changes, made since a snapshot"
+
+	def __init__(self, file, snapshot, threshold = 1024 * 1024):
+		self.file	= os.path.expanduser(file)
+		self.snapshot	= os.path.expanduser(snapshot)
+		self.threshold	= threshold
+
+		self.handle	= None
+		self.lock	= threading.Lock()
+
+		# bytes of valid data in the journal, and of records in it
+		self.length	= 0
+		self.size	= 0
+
+
+	def __decode(self, line):
+		"Decodes a journal record, or returns None if it is damaged"
+
+		if line[-1:] != "\n" or line.find(" ") != 8:
+			return None
+
+		checksum, body = line[:-1].split(" ", 1)
+
+		if checksum != "%08x" % (zlib.crc32(body) & 0xffffffffL):
+			return None
+
+		fields = []
+
+		for field in body.split("\t"):
+			fields.append(field.decode("string_escape"))
+
+		return fields
+
+
+	def __get_header(self):
+		"Returns the journal header, identifying the snapshot"
+
+		try:
+			info = os.stat(self.snapshot)
+
+			return "sputnik-journal 1 %i %i\n" % ( info.st_size, info.st_mtime )
+
+		except OSError:
+			return "sputnik-journal 1 -1 -1\n"
+
+
+	def __encode(self, fields):
+		"Encodes a journal record"
+
+		encoded = []
+
+		for field in fields:
+			encoded.append(str(field).encode("string_escape"))
+
+		body = "\t".join(encoded)
+
+		return "%08x %s\n" % ( zlib.crc32(body) & 0xffffffffL, body )
+
+
+	def __write(self, data):
+		"Appends records to the journal"
+
+		self.lock.acquire()
+
+		try:
+			# drop any damaged record at the end, and a journal
+			# which doesn't belong to the snapshot
+			if self.handle == None:
+				if self.length == 0:
+					directory = os.path.dirname(self.file)
+
+					if os.path.isdir(directory) == False:
+						os.makedirs(directory)
+
+					self.handle = open(self.file, "wb")
+					self.handle.write(self.__get_header())
+					self.length = self.handle.tell()
 
-		return True
+				else:
+					self.handle = open(self.file, "r+b")
+					self.handle.truncate(self.length)
+					self.handle.seek(self.length)
 
+			# sync once per append, so a crash loses at most the
+			# tail of the transaction being written
+			self.handle.write(data)
+			self.handle.flush()
+			os.fsync(self.handle.fileno())
 
-	def __cb_bus_state_changed(self, message):
-		"Callback for bus state changed messages"
+			self.length	+= len(data)
+			self.size	+= len(data)
 
-		newstate = message.structure["new-state"]
-		oldstate = message.structure["old-state"]
-		state	= self.state
+		finally:
+			self.lock.release()
 
-		if newstate == gst.STATE_NULL:
-			if self.state not in ( STATE_STOPPED, STATE_ERROR ):
-				state = STATE_STOPPED
 
-		elif newstate in ( gst.STATE_READY, gst.STATE_PAUSED ):
-			pass
+	def compact(self, mark):
+		"Restarts the journal from a new snapshot, keeping records after a mark"
 
-		elif newstate == gst.STATE_PLAYING:
-			state = STATE_PLAYING
+		self.lock.acquire()
 
-		else:
-			print "Uncaught state change:", oldstate, newstate
+		try:
+			tail = ""
 
-		self.__set_state(state)
+			if self.handle != None:
+				self.handle.close()
+				self.handle = None
 
-		return True
+			if self.length > mark:
+				handle = open(self.file, "rb")
+				handle.seek(mark)
+				tail = handle.read(self.length - mark)
+				handle.close()
 
+			temp = "%s.%i.tmp" % ( self.file, os.getpid() )
+			handle = open(temp, "wb")
+			handle.write(self.__get_header() + tail)
+			handle.flush()
+			os.fsync(handle.fileno())
+			self.length = handle.tell()
+			handle.close()
 
-	def __cb_bus_taglist(self, message):
-		"Callback for tag lists"
+			os.rename(temp, self.file)
+			self.size = len(tail)
 
-		taglist = dict(message.structure)
+		finally:
+			self.lock.release()
 
-		meta = {}
 
-		# name
-		if taglist.has_key("iradio-name"):
-			meta["name"] = taglist["iradio-name"]
+	def get_mark(self):
+		"Returns the journal position, to compact up to"
 
-		# description
-		if taglist.has_key("iradio-genre"):
-			meta["description"] = taglist["iradio-genre"]
+		self.lock.acquire()
+		mark = self.length
+		self.lock.release()
 
-		# website
-		if taglist.has_key("iradio-url"):
-			meta["website"] = taglist["iradio-url"]
+		return mark
 
-		# playing
-		if taglist.has_key("iradio-title"):
-			meta["playing"] = taglist["iradio-title"]
 
-		elif taglist.has_key("artist") and taglist.has_key("title"):
-			meta["playing"] = taglist["artist"] + " - " + taglist["title"]
+	def needs_compaction(self):
+		"Checks if the journal has grown past its threshold"
 
-			if taglist["title"] == "" and meta["playing"][-3:] == " - ":
-				meta["playing"] = meta["playing"][:-3]
+		return self.size >= self.threshold
 
-		# format
-		if taglist.has_key("audio-codec"):
-			meta["format"] = taglist["audio-codec"]
 
-		if meta.get("format") == "MPEG" and taglist.has_key("layer"):
-			meta["format"] += " layer " + str(taglist["layer"])
+	def replay(self, stationlist):
+		"Applies the journal to a station list loaded from the snapshot"
 
-		# bitrate
-		if taglist.has_key("nominal-bitrate"):
-			meta["bitrate"] = int(taglist["nominal-bitrate"] / 1000)
+		try:
+			handle = open(self.file, "rb")
 
-		elif taglist.has_key("bitrate"):
-			meta["bitrate"] = int(taglist["bitrate"] / 1000)
+		except IOError:
+			return 0
 
-		# codec data
-		meta["codec"]	= taglist
+		count = 0
 
-		self.__set_meta(meta)
+		# a journal for another snapshot is outdated, and is restarted
+		if handle.readline() == self.__get_header():
+			self.length = handle.tell()
 
-		return True
+			for line in handle:
+				fields = self.__decode(line)
 
+				if fields == None or len(fields) < 2:
+					break
 
-	def __clear_meta(self):
-		"Clears the metadata"
+				try:
+					op, index = fields[0], int(fields[1])
 
-		for key in self.meta.keys():
-			self.meta[key] = None
+				except ValueError:
+					break
 
-		self.emit("meta-changed", self.meta)
+				if op in ( "add", "update" ) and len(fields) >= 5:
+					station			= Station()
+					station.name		= fields[2]
+					station.description	= fields[3]
+					station.website		= fields[4]
+					station.streams		= fields[5:]
 
+					if op == "add":
+						stationlist.add_station(station)
 
-	def __set_error(self, error):
-		"Sets an error state"
+					else:
+						stationlist.update_station(index, station)
 
-		self.stop()
-		self.__set_state(STATE_ERROR, error)
+				elif op == "remove":
+					stationlist.remove_station(index)
 
+				else:
+					break
 
-	def __set_meta(self, meta):
-		"Sets meta data"
+				self.length	+= len(line)
+				self.size	+= len(line)
+				count		+= 1
 
-		changed = False
+		handle.close()
 
-		for key, value in meta.items():
-			if self.meta.has_key(key) == False:
-				continue
+		return count
 
-			elif self.meta[key] == value:
-				continue
 
-			self.meta[key] = value
-			changed = True
+	def write(self, changes):
+		"Records the ( kind, index, station, previous ) changes of a transaction, in one append"
 
-		if changed == True:
-			self.emit("meta-changed", self.meta)
-			pass
+		records = []
 
+		for kind, index, station, previous in changes:
+			if kind == CHANGE_ADD:
+				records.append(self.__encode([ "add", -1, station.name, station.description, station.website ] + list(station.streams)))
 
-	def __set_state(self, state, data = None):
-		"Sets the current state"
+			elif kind == CHANGE_REMOVE:
+				records.append(self.__encode([ "remove", index ]))
 
-		if self.state == state and data == None:
-			return
+			elif kind == CHANGE_UPDATE:
+				records.append(self.__encode([ "update", index, station.name, station.description, station.website ] + list(station.streams)))
 
-		self.state = state
-		self.emit("state-changed", state, data)
+		if len(records) > 0:
+			self.__write("".join(records))
 
 
-	def get_duration(self):
-		"Gets the current pipeline duration"
 
-		return self.pipeline.get_duration()
+class StationListParser:
+	"An incremental station list parser, which builds stations as their elements close"
 
+	def __init__(self):
+		self.cdata	= False
+		self.depth	= 0
+		self.error	= False
+		self.field	= None
+		self.started	= False
+		self.station	= None
+		self.stations	= []
+		self.streams	= []
+		self.text	= []
 
-	def get_position(self):
-		"Gets the current pipeline position"
+		self.parser = xml.parsers.expat.ParserCreate()
+		self.parser.StartElementHandler		= self.__cb_element_start
+		self.parser.EndElementHandler		= self.__cb_element_end
+		self.parser.CharacterDataHandler	= self.__cb_text
+		self.parser.StartCdataSectionHandler	= self.__cb_cdata_start
+		self.parser.EndCdataSectionHandler	= self.__cb_cdata_end
+		self.parser.CommentHandler		= self.__cb_markup
+		self.parser.ProcessingInstructionHandler	= self.__cb_markup
 
-		return self.pipeline.get_position()
 
+	def __cb_cdata_end(self):
+		"Callback for the end of CDATA sections"
 
-	def get_volume(self):
-		"Gets the current pipeline volume"
+		self.cdata = False
 
-		return self.pipeline.get_volume()
 
+	def __cb_cdata_start(self):
+		"Callback for the start of CDATA sections"
 
-	def play(self, uris):
-		"Plays a list of uris"
+		self.cdata = True
+		self.__check_markup()
 
-		self.stop()
-		self.__clear_meta()
 
-		if uris == None or len(uris) == 0:
-			self.__set_error("No streams found")
+	def __cb_element_end(self, name):
+		"Callback for closing elements"
 
-		for uri in uris:
-			try:
-				self.__set_state(STATE_CONNECTING, uri)
-				self.pipeline.play(uri)
+		self.depth -= 1
 
-				return True
+		if self.error == True:
+			return
 
-			except PlayError:
-				continue
+		elif self.depth == 1:
+			self.station.streams = self.streams
+			self.stations.append(self.station)
 
-		else:
-			self.__set_error("Unable to play stream")
+			self.station = None
+			self.streams = []
 
-		return False
+		elif self.depth == 2 and self.field != None:
+			text = "".join(self.text).encode("utf-8")
 
+			if self.field == "stream":
+				self.streams.append(text)
 
-	def set_volume(self, volume):
-		"Sets the pipeline volume"
+			else:
+				setattr(self.station, self.field, text)
 
-		return self.pipeline.set_volume(volume)
+			self.field	= None
+			self.text	= []
 
 
-	def stop(self):
-		"Stops the player"
+	def __cb_element_start(self, name, attributes):
+		"Callback for opening elements"
 
-		if self.state == STATE_STOPPED:
-			return
+		self.depth += 1
 
-		self.pipeline.stop()
+		if self.error == True:
+			return
 
-		self.__set_state(STATE_STOPPED)
+		elif self.depth == 1 and name != "stations":
+			self.error = True
 
+		elif self.depth == 2:
+			if name == "station":
+				self.station = Station()
 
+			else:
+				self.error = True
 
-class Playlist(gobject.GObject):
-	"A playlist"
+		elif self.depth == 3 and name in ( "name", "description", "website", "stream" ):
+			self.field = name
 
-	def __init__(self, data = None):
-		gobject.GObject.__init__(self)
 
-		self.list	= []
+	def __cb_markup(self, *args):
+		"Callback for comments and processing instructions"
 
-		if data != None:
-			self.import_data(data)
+		self.__check_markup()
 
 
-	def add_files(self, files):
-		"Adds a list of files to the playlist"
+	def __cb_text(self, text):
+		"Callback for character data"
 
-		for file in files:
-			self.list.append(file)
+		# only text directly inside a field is used, like util.dom_text()
+		if self.field != None and self.depth == 3 and self.cdata == False:
+			self.text.append(text)
 
 
-	def clear(self):
-		"Clears the playlist"
+	def __check_markup(self):
+		"Flags markup other than stations in the station list"
 
-		self.list = []
+		if self.depth == 1:
+			self.error = True
 
 
-	def export_pls(self):
-		"Saves the playlist to a file"
+	def close(self):
+		"Finishes parsing"
 
-		data = "[playlist]\n"
-		data += "NumberOfEntries=%i\n" % len(self.list)
+		self.parser.Parse("", True)
 
-		for index, item in zip(range(len(self.list)), self.list):
-			data += "File%i=%s\n" % (index + 1, item)
 
-		return data
+	def feed(self, data):
+		"Parses a chunk of data"
 
+		# leading whitespace is skipped, as before an xml declaration
+		if self.started == False:
+			data = data.lstrip()
 
-	def get_files(self):
-		"Returns a list of the files in the playlist"
+			if data == "":
+				return
 
-		return self.list
+			self.started = True
 
+		self.parser.Parse(data, False)
 
-	def import_asx(self, data):
-		"Reads data from an ASX playlist"
 
-		try:
-			dom = xml.dom.minidom.parseString(data.strip())
 
-			if dom.documentElement.nodeName.lower() != "asx":
-				raise DataError
+class StationListSaver:
+	"Saves a station list in the background, once a burst of changes has settled"
 
-			refnodes = [ node for node in dom.documentElement.getElementsByTagName("*") if node.nodeName.lower() == "ref" ]
+	def __init__(self, stationlist, file, delay = 2000, journal = None):
+		self.delay		= delay
+		self.file		= file
+		self.journal		= journal
+		self.stationlist	= stationlist
 
-			for node in refnodes:
-				for i in range(node.attributes.length):
-					attr = node.attributes.item(i)
+		self.changes	= 0
+		self.coalesced	= 0
+		self.dirty	= False
+		self.error	= None
+		self.saves	= 0
+		self.thread	= None
+		self.timer	= None
 
-					if attr.name.lower() == "href" and attr.value.strip() != "":
-						self.list.append(attr.value.strip())
+		self.stationlist.connect("changed", self.__cb_changed)
 
-		except ExpatError:
-			raise DataError
 
+	def __cb_changed(self, widget, data = None):
+		"Callback for station list changes"
 
-	def import_data(self, data):
-		"Reads data from a playlist"
+		self.changes += 1
 
-		if data.strip()[:10] == "[playlist]":
-			self.import_pls(data)
+		# with a journal, changes are already on disk, and the
+		# snapshot is only rewritten once the journal has grown
+		if self.journal != None and self.journal.needs_compaction() == False:
+			self.coalesced += 1
+			return
 
-		elif "<asx" in data.lower():
-			self.import_asx(data)
+		self.dirty = True
 
-		else:
-			self.import_m3u(data)
+		# restart the quiet period, folding this change into the pending save
+		if self.timer != None:
+			gobject.source_remove(self.timer)
+			self.coalesced += 1
 
-		if len(self.get_files()) == 0:
-			raise DataError
+		self.timer = gobject.timeout_add(self.delay, self.__cb_timer)
 
 
-	def import_m3u(self, data):
-		"Reads data from an M3U playlist"
+	def __cb_timer(self):
+		"Callback for saving once changes have settled"
 
-		for item in data.splitlines():
-			item = item.strip()
+		self.timer = None
 
-			if item == "":
-				continue
+		# wait for a running save to finish, rather than writing twice at once
+		if self.thread != None and self.thread.isAlive() == True:
+			self.timer = gobject.timeout_add(self.delay, self.__cb_timer)
+			return False
 
-			elif item[0] == "#":
-				continue
+		mark = self.journal and self.journal.get_mark() or 0
 
-			elif not re.match("^[a-z]+://\S+$", item, re.IGNORECASE):
-				continue
+		self.thread = threading.Thread(target = self.__save, args = ( self.__snapshot(), mark ))
+		self.thread.start()
 
-			self.list.append(item)
+		return False
 
 
-	def import_pls(self, data):
-		"Reads data from a PLS playlist"
+	def __save(self, snapshot, mark = 0):
+		"Writes a snapshot of the station list, from the saver thread"
 
-		items = {}
+		try:
+			io.write_atomic(self.file, snapshot.write_xml)
+			self.error = None
 
-		for item in data.splitlines():
+			# changes up to the snapshot are now in it
+			if self.journal != None:
+				self.journal.compact(mark)
 
-			if "=" not in item:
-				continue
+		except IOError, error:
+			self.error = error
+			self.dirty = True
 
-			key, value = item.split("=", 1)
-			key = key.strip().lower()
-			value = value.strip()
 
-			m = re.match("file(\d+)", key)
+	def __snapshot(self):
+		"Returns a copy of the station list to save, and marks it clean"
 
-			if m == None:
-				continue
+		snapshot		= StationList()
+		snapshot.stations	= self.stationlist.get_stations()[:]
 
-			items[int(m.group(1))] = value
+		self.dirty	= False
+		self.saves	+= 1
 
+		return snapshot
 
-		# handle items
-		keys = items.keys()
-		keys.sort()
 
-		for index in keys:
-			self.list.append(items[index])
+	def flush(self):
+		"Saves pending changes right away, and waits for them to be written"
 
+		if self.timer != None:
+			gobject.source_remove(self.timer)
+			self.timer = None
 
+		if self.thread != None:
+			self.thread.join()
+			self.thread = None
 
-class Station(gobject.GObject):
-	"Info about a station"
+		# a journal holds the changes already, so compaction can wait
+		if self.dirty == True and self.journal == None:
+			self.__save(self.__snapshot())
 
-	def __init__(self):
-		gobject.GObject.__init__(self)
+		if self.error != None:
+			raise IOError, self.error
 
-		self.name		= ""
-		self.description	= ""
-		self.website		= ""
-		self.streams		= []
-		self.metaupdate		= True
 
 
+class StationListView:
+	"A sequence of the stations in a database, read a page at a time"
 
-class StationList(gobject.GObject):
-	"A station list"
+	def __init__(self, database):
+		self.database	= database
+		self.page	= []
+		self.pagestart	= 0
 
-	__gsignals__ = {
-		"changed"	: ( gobject.SIGNAL_ACTION, None, () ),
-	}
 
-	def __init__(self):
-		gobject.GObject.__init__(self)
+	def __getitem__(self, index):
+		"Returns the station at an index"
 
-		self.stations = []
+		if index < 0:
+			index += len(self)
 
+		if index < self.pagestart or index >= self.pagestart + len(self.page):
+			self.pagestart	= index - index % self.database.pagesize
+			self.page	= self.database.get_page(self.pagestart, self.database.pagesize)
 
-	def add_station(self, station):
-		"Adds a station to the list"
+		if index < self.pagestart or index >= self.pagestart + len(self.page):
+			raise IndexError
 
-		station.metaupdate = False
-		self.stations.append(station)
+		return self.page[index - self.pagestart]
 
-		self.emit("changed")
 
+	def __getslice__(self, start, end):
+		"Returns a list of the stations in a range"
 
-	def export_xml(self):
-		"Saves the station list as XML"
+		start	= max(start, 0)
+		end	= min(end, len(self))
 
-		data = ""
-		data += "<?xml version=\"1.0\" encoding=\"utf-8\" ?>\n"
-		data += "<stations>\n"
+		return self.database.get_page(start, max(end - start, 0))
 
-		for station in self.stations:
-			data += "	<station>\n"
-			data += "		<name>%s</name>\n" % util.escape_markup(station.name)
-			data += "		<description>%s</description>\n" % util.escape_markup(station.description)
-			data += "		<website>%s</website>\n" % util.escape_markup(station.website)
 
-			for stream in station.streams:
-				data += "		<stream>%s</stream>\n" % util.escape_markup(stream)
+	def __iter__(self):
+		"Iterates over the stations, a page at a time"
 
-			data += "	</station>\n"
+		for start in range(0, len(self), self.database.pagesize):
+			for station in self.database.get_page(start, self.database.pagesize):
+				yield station
 
-		data += "</stations>\n"
 
-		return data
+	def __len__(self):
+		"Returns the number of stations"
 
+		return self.database.get_count()
 
-	def get_station(self, index):
-		"Fetches a station from the list"
 
-		try:
-			return self.stations[index]
 
-		except IndexError:
-			return None
+class StationTable:
+	"A columnar form of a station list, for bulk handling of large catalogs"
 
+	def __init__(self, stations = None):
+		self.descriptions	= []
+		self.names		= []
+		self.streams		= []
+		self.websites		= []
 
-	def get_stations(self):
-		"Returns a list of all stations"
+		if stations != None:
+			for station in stations:
+				self.add_station(station)
 
-		return self.stations
 
+	def __len__(self):
+		"Returns the number of stations"
 
-	def import_xml(self, data):
-		"Loads stationlist from XML"
+		return len(self.names)
 
-		try:
-			dom = xml.dom.minidom.parseString(data.strip())
 
-			if dom.documentElement.nodeName != "stations":
-				raise DataError
+	def add_station(self, station):
+		"Adds a station to the table"
 
+		# station fields are already shared and immutable
+		self.descriptions.append(station.description)
+		self.names.append(station.name)
+		self.streams.append(station.streams)
+		self.websites.append(station.website)
 
-			for node in dom.documentElement.childNodes:
 
-				# check node type
-				if node.nodeType == node.TEXT_NODE:
-					continue
+	def add_table(self, table):
+		"Adds the stations of another table"
 
-				if node.nodeType != node.ELEMENT_NODE or node.nodeName != "station":
-					raise DataError
+		self.descriptions.extend(table.descriptions)
+		self.names.extend(table.names)
+		self.streams.extend(table.streams)
+		self.websites.extend(table.websites)
 
-				# import station
-				station = Station()
 
-				for child in node.childNodes:
+	def get_station(self, index):
+		"Builds a station from a row of the table"
 
-					if child.nodeType != child.ELEMENT_NODE:
-						continue
+		try:
+			station = Station(self.names[index], self.descriptions[index], self.websites[index], self.streams[index])
 
-					elif child.nodeName == "name":
-						station.name = util.dom_text(child)
+		except IndexError:
+			return None
 
-					elif child.nodeName == "description":
-						station.description = util.dom_text(child)
+		station.metaupdate = False
 
-					elif child.nodeName == "website":
-						station.website = util.dom_text(child)
+		return station
 
-					elif child.nodeName == "stream":
-						station.streams.append(util.dom_text(child))
 
-					else:
-						continue
+	def get_stations(self):
+		"Builds a list of all stations"
 
-				self.add_station(station)
+		return [ self.get_station(index) for index in range(len(self)) ]
 
 
-		except ExpatError:
-			raise DataError
+	def import_xml(self, data):
+		"Loads stations from XML, given as a string or an iterable of chunks"
 
+		if type(data) in types.StringTypes:
+			data = [ data ]
 
-	def remove_station(self, index):
-		"Removes a station from the list"
+		parser	= StationListParser()
+		table	= StationTable()
 
 		try:
-			del self.stations[index]
+			for chunk in data:
+				parser.feed(chunk)
 
-			self.emit("changed")
+				# fold stations into columns as they are parsed
+				for station in parser.stations:
+					table.add_station(station)
 
-		except IndexError:
-			return None
+				parser.stations = []
 
+			parser.close()
 
-	def update_station(self, index, station):
-		"Updates a station"
-
-		try:
-			station.metaupdate	= False
-			self.stations[index]	= station
+		except ExpatError:
+			raise DataError
 
-			self.emit("changed")
+		# stations before invalid data are kept, as long as the XML is well-formed
+		for station in parser.stations:
+			table.add_station(station)
 
-		except IndexError:
-			return None
+		self.add_table(table)
 
+		if parser.error == True:
+			raise DataError
@@ -0,0 +1,321 @@
+#
+# Sputnik - an internet radio player
+# http://oss.codepoet.no/sputnik/
+# $Id$
+#
+# schedule.py - scheduled recordings and playback
+#
+#
+# Copyright (c) 2006 Erik Grinaker
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+
+import gobject, heapq, re, time
+
+
+ACTION_PLAY	= "play"
+ACTION_RECORD	= "record"
+
+# events at the same time are handled in this order, so that a
+# job starting when another ends on the same station can take
+# over its connection
+EVENT_PREPARE	= 0
+EVENT_START	= 1
+EVENT_STOP	= 2
+
+WEEKDAYS	= ( "mon", "tue", "wed", "thu", "fri", "sat", "sun" )
+
+
+class ScheduleError(Exception):
+	"Exception for invalid schedules"
+	pass
+
+
+
+def parse(data, stations, now = None):
+	"Parses a schedule, returning a list of jobs"
+
+	if now == None:
+		now = time.time()
+
+	names	= {}
+	jobs	= []
+
+	for station in stations:
+		names[station.name] = station
+
+	for line in data.splitlines():
+		line = line.strip()
+
+		if line == "" or line[0] == "#":
+			continue
+
+		# <weekday or yyyy-mm-dd> <hh:mm> <minutes> <action> <station>
+		match = re.match("^(\S+)\s+(\d\d?):(\d\d)\s+(\d+)\s+(\S+)\s+(.+)$", line)
+
+		if match == None:
+			raise ScheduleError("Invalid schedule entry '%s'" % line)
+
+		day, hour, minute, duration, action, name = match.groups()
+
+		if action not in ( ACTION_PLAY, ACTION_RECORD ):
+			raise ScheduleError("Invalid action '%s'" % action)
+
+		if names.has_key(name) == False:
+			raise ScheduleError("No station named '%s'" % name)
+
+		if day.lower() in WEEKDAYS:
+			tm	= time.localtime(now)
+			days	= (WEEKDAYS.index(day.lower()) - tm[6]) % 7
+			start	= time.mktime(( tm[0], tm[1], tm[2] + days, int(hour), int(minute), 0, 0, 0, -1 ))
+			weekly	= True
+
+		else:
+			try:
+				tm	= time.strptime(day, "%Y-%m-%d")
+				start	= time.mktime(( tm[0], tm[1], tm[2], int(hour), int(minute), 0, 0, 0, -1 ))
+				weekly	= False
+
+			except ValueError:
+				raise ScheduleError("Invalid day '%s'" % day)
+
+		jobs.append(Job(names[name], start, int(duration) * 60, action, weekly))
+
+	return jobs
+
+
+
+class Job:
+	"A scheduled recording or playback of a station"
+
+	def __init__(self, station, start, duration, action = ACTION_RECORD, weekly = False):
+		self.action	= action
+		self.duration	= duration
+		self.start	= start
+		self.station	= station
+		self.weekly	= weekly
+
+		self.cancelled	= False
+		self.events	= 0
+		self.prepared	= False
+		self.started	= False
+
+
+	def get_end(self):
+		"Returns the time the job ends"
+
+		return self.start + self.duration
+
+
+	def next_week(self):
+		"Moves the job to the same local time next week"
+
+		tm = time.localtime(self.start)
+		self.start = time.mktime(( tm[0], tm[1], tm[2] + 7, tm[3], tm[4], tm[5], 0, 0, -1 ))
+
+
+
+class Scheduler(gobject.GObject):
+	"Starts and stops scheduled jobs, from a single timer"
+
+	__gsignals__ = {
+		"prepare"	: ( gobject.SIGNAL_ACTION, gobject.TYPE_NONE, ( gobject.TYPE_PYOBJECT, )),
+		"release"	: ( gobject.SIGNAL_ACTION, gobject.TYPE_NONE, ( gobject.TYPE_PYOBJECT, )),
+		"start"		: ( gobject.SIGNAL_ACTION, gobject.TYPE_NONE, ( gobject.TYPE_PYOBJECT, )),
+		"stop"		: ( gobject.SIGNAL_ACTION, gobject.TYPE_NONE, ( gobject.TYPE_PYOBJECT, )),
+	}
+
+	def __init__(self, preconnect = 5):
+		gobject.GObject.__init__(self)
+
+		self.cancelled	= 0
+		self.due	= None
+		self.events	= []
+		self.jobs	= {}
+		self.sequence	= 0
+		self.timer	= None
+
+		# stations are connected this many seconds before a job
+		# starts, and stay connected while any job needs them
+		self.preconnect	= preconnect
+		self.sessions	= {}
+
+		# the timer is re-armed at least this often, to follow
+		# clock changes and suspends
+		self.maxwait	= 60
+
+
+	def __cb_timer(self):
+		"Callback for handling due events"
+
+		self.due	= None
+		self.timer	= None
+		now		= time.time()
+
+		while len(self.events) > 0 and self.events[0][0] <= now:
+			when, event, sequence, job = heapq.heappop(self.events)
+			job.events -= 1
+
+			if job.cancelled == True:
+				self.cancelled -= 1
+
+			elif event == EVENT_PREPARE:
+				self.__prepare(job)
+
+			elif event == EVENT_START:
+				job.started = True
+				self.emit("start", job)
+
+			elif event == EVENT_STOP:
+				self.__finish(job)
+
+				if job.weekly == True:
+					job.next_week()
+					self.__push(job)
+
+				else:
+					del self.jobs[job]
+
+		self.__schedule()
+
+		return False
+
+
+	def __finish(self, job):
+		"Stops a job, releasing its station when no other job needs it"
+
+		if job.started == True:
+			job.started = False
+			self.emit("stop", job)
+
+		if job.prepared == True:
+			job.prepared = False
+			self.sessions[job.station] -= 1
+
+			if self.sessions[job.station] == 0:
+				del self.sessions[job.station]
+				self.emit("release", job.station)
+
+
+	def __prepare(self, job):
+		"Prepares a job, connecting its station unless already connected"
+
+		job.prepared	= True
+		count		= self.sessions.get(job.station, 0)
+
+		self.sessions[job.station] = count + 1
+
+		if count == 0:
+			self.emit("prepare", job.station)
+
+
+	def __push(self, job):
+		"Queues the events of a job"
+
+		for when, event in ( job.start - self.preconnect, EVENT_PREPARE ), ( job.start, EVENT_START ), ( job.get_end(), EVENT_STOP ):
+			self.sequence += 1
+			heapq.heappush(self.events, ( when, event, self.sequence, job ))
+			job.events += 1
+
+
+	def __schedule(self):
+		"Arms the timer for the next event"
+
+		if self.timer != None:
+			gobject.source_remove(self.timer)
+			self.timer = None
+
+		# drop cancelled events once they make up most of the queue
+		if self.cancelled > len(self.events) / 2:
+			events = []
+
+			for item in self.events:
+				if item[3].cancelled == False:
+					events.append(item)
+
+				else:
+					item[3].events = 0
+
+			self.events	= events
+			self.cancelled	= 0
+			heapq.heapify(self.events)
+
+		if len(self.events) == 0:
+			self.due = None
+			return
+
+		self.due	= self.events[0][0]
+		delay		= min(max(self.due - time.time(), 0), self.maxwait)
+		self.timer	= gobject.timeout_add(int(delay * 1000), self.__cb_timer)
+
+
+	def add(self, job):
+		"Adds a job to the schedule"
+
+		now = time.time()
+
+		# weekly jobs continue from their next occurrence
+		while job.weekly == True and job.get_end() <= now:
+			job.next_week()
+
+		if job.get_end() <= now or self.jobs.has_key(job) == True:
+			return
+
+		# drop events left from an earlier removal of the job
+		if job.events > 0:
+			self.events = [ item for item in self.events if item[3] != job ]
+			self.cancelled -= job.events
+			job.events = 0
+			heapq.heapify(self.events)
+
+		job.cancelled	= False
+		self.jobs[job]	= None
+		self.__push(job)
+
+		if self.due == None or job.start - self.preconnect < self.due:
+			self.__schedule()
+
+
+	def clear(self):
+		"Removes all jobs"
+
+		for job in self.jobs.keys():
+			self.remove(job)
+
+
+	def get_jobs(self):
+		"Returns the scheduled jobs, by start time"
+
+		jobs = [ ( job.start, job ) for job in self.jobs.keys() ]
+		jobs.sort()
+
+		return [ job for start, job in jobs ]
+
+
+	def remove(self, job):
+		"Removes a job, stopping it if running"
+
+		if self.jobs.has_key(job) == False:
+			return
+
+		del self.jobs[job]
+
+		job.cancelled	= True
+		self.cancelled	+= job.events
+
+		self.__finish(job)
+		self.__schedule()
+
@@ -23,8 +23,8 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
-import io, util
-import gnome, gnome.ui, gobject, gtk, pango, re, xml.dom.minidom
+import io, media, util
+import bisect, gnome, gnome.ui, gobject, gtk, pango, re, xml.dom.minidom
 
 from xml.parsers.expat import ExpatError
 
@@ -53,6 +53,10 @@ STOCKITEMS = (
 ICON_SIZE_DIALOG	= gtk.ICON_SIZE_DIALOG
 ICON_SIZE_LABEL		= gtk.ICON_SIZE_MENU
 
+SORT_ADDED		= "added"
+SORT_DESCRIPTION	= "description"
+SORT_NAME		= "name"
+
 
 
 ##### CONTAINERS #####
@@ -732,6 +736,16 @@ class Button(gtk.Button):
 
 
 
+class ImageButton(Button):
+	"A button showing only an icon"
+
+	def __init__(self, stock, callback = None):
+		Button.__init__(self, None, callback)
+
+		self.add(Image(stock, gtk.ICON_SIZE_LARGE_TOOLBAR))
+
+
+
 class ToggleButton(gtk.ToggleButton):
 	"A toggle button"
 
@@ -745,6 +759,16 @@ class ToggleButton(gtk.ToggleButton):
 
 
 
+class PauseButton(ToggleButton):
+	"A pause button"
+
+	def __init__(self):
+		ToggleButton.__init__(self)
+
+		self.add(Image(gtk.STOCK_MEDIA_PAUSE, gtk.ICON_SIZE_LARGE_TOOLBAR))
+
+
+
 class PlayButton(ToggleButton):
 	"A play/stop button"
 
@@ -1039,6 +1063,9 @@ class StationInfo(VBox):
 		if text == None:
 			text = ""
 
+		if ( icon, text, tooltip ) == ( self.statusicon, self.status, self.statustip ):
+			return
+
 		self.status	= text
 		self.statusicon	= icon
 		self.statustip	= tooltip
@@ -1057,21 +1084,31 @@ class StationList(TreeView):
 		self.set_rules_hint(True)
 		self.set_fixed_height_mode(True)
 
-		# set up list store
-		self.liststore = gtk.ListStore(gobject.TYPE_STRING, gobject.TYPE_PYOBJECT, gobject.TYPE_INT)
-		self.liststore.set_sort_func(0, self.__cb_sort)
-		self.liststore.set_sort_column_id(0, gtk.SORT_ASCENDING)
-
+		# each station has a row of its sort key, a key for the
+		# search index and its current index in the station list,
+		# so that rows compare in display order
+		self.index	= None
+		self.keyrows	= {}
+		self.rowkey	= 0
+		self.rows	= []
+		self.sort	= SORT_NAME
+		self.sorted	= []
+
+		# set up filter - searches are delayed while typing, and the
+		# shown rows are moved towards the result a chunk at a time
+		self.cursor		= 0
+		self.filterchunk	= 500
+		self.filterdelay	= 150
+		self.filteridle		= None
+		self.filterquery	= ""
+		self.filtertext		= ""
+		self.filtertimer	= None
+		self.matches		= None
+		self.target		= []
+
+		self.stationmodel = StationModel(stationlist)
 		self.set_stations(stationlist)
 
-		# set up filter
-		self.filtertext = ""
-
-		self.filtermodel = self.liststore.filter_new()
-		self.filtermodel.set_visible_func(self.__cb_filter)
-
-		self.set_model(self.filtermodel)
-
 		# set up column rendering
 		self.cr = gtk.CellRendererText()
 		self.cr.set_property("ellipsize", pango.ELLIPSIZE_END)
@@ -1084,60 +1121,306 @@ class StationList(TreeView):
 		self.append_column(self.column)
 
 		# set up signal handling
+		self.connect("destroy", self.__cb_destroy)
 		self.connect("realize", self.__cb_realize)
 
 
-	def __cb_filter(self, model, iter, data = None):
-		"Callback for liststore filtering"
+	def __cb_destroy(self, widget, data = None):
+		"Callback for destroy signals"
 
-		if self.filtertext in ( None, "" ):
-			return True
+		for source in ( self.filteridle, self.filtertimer ):
+			if source != None:
+				gobject.source_remove(source)
+
+		self.filteridle		= None
+		self.filtertimer	= None
+
+
+	def __cb_filter_idle(self):
+		"Callback for moving the shown rows towards the search result"
+
+		view	= self.stationmodel.view
+		steps	= 0
+
+		# both lists are in display order, so they can be merged in one
+		# pass - rows already in place are cheap, and aren't counted
+		while steps < self.filterchunk:
+			i = self.cursor
+
+			if i >= len(view) and i >= len(self.target):
+				break
+
+			elif i < len(view) and i < len(self.target) and view[i] is self.target[i]:
+				self.cursor += 1
+				continue
+
+			elif i >= len(self.target) or (i < len(view) and view[i] < self.target[i]):
+				self.stationmodel.remove_row(i)
+
+			else:
+				self.stationmodel.insert_row(i, self.target[i])
 
-		text = model.get_value(iter, 0)
+			steps += 1
 
-		if text != None and self.filtertext.lower() in text.lower():
+		if steps == self.filterchunk:
 			return True
 
+		self.filteridle = None
+
+		if len(view) > 0:
+			self.select(self.stationmodel.get_iter(( 0, )))
+
 		else:
-			return False
+			self.unselect_all()
+
+		return False
+
+
+	def __cb_filter_timer(self):
+		"Callback for searching once typing has paused"
+
+		self.filtertimer = None
+		self.__refilter(self.filterquery)
+
+		return False
 
 
 	def __cb_realize(self, widget, data = None):
 		"Callback for realize signals"
 
-		if self.filtermodel.iter_n_children(None) > 0:
-			self.select(self.filtermodel.iter_children(None))
+		if self.stationmodel.iter_n_children(None) > 0:
+			self.select(self.stationmodel.iter_children(None))
+
+
+	def __get_index(self):
+		"Returns the search index, building it on first use"
+
+		if self.index == None:
+			self.index = media.StationIndex()
+
+			for row, station in zip(self.rows, self.stationlist.get_stations()):
+				self.index.add(row[1], station)
+
+		return self.index
+
+
+	def __get_sort_key(self, station, key):
+		"Returns the sort key of a station, for the current sort order"
+
+		if self.sort == SORT_ADDED:
+			return key
+
+		name		= unicode(station.name, "utf-8", "replace").lower().encode("utf-8")
+		description	= unicode(station.description, "utf-8", "replace").lower().encode("utf-8")
+
+		if self.sort == SORT_DESCRIPTION:
+			return description + "\n" + name
+
+		else:
+			return name + "\n" + description
+
+
+	def __hide_row(self, row):
+		"Removes a row from the sorted, target and shown rows"
+
+		for rows in ( self.sorted, self.target, self.stationmodel.view ):
+			position = bisect.bisect_left(rows, row)
+
+			if position == len(rows) or rows[position] is not row:
+				continue
+
+			elif rows is self.stationmodel.view:
+				self.stationmodel.remove_row(position)
+
+			else:
+				del rows[position]
+
+		if self.matches != None and self.matches.has_key(row[1]) == True:
+			del self.matches[row[1]]
 
+		self.cursor = 0
 
-	def __cb_sort(self, model, iter1, iter2, data = None):
-		"Callback for liststore sorting"
 
-		station1 = model.get(iter1, 1)[0]
-		station2 = model.get(iter2, 1)[0]
+	def __rebuild(self):
+		"Shows the target rows, replacing the model contents at once"
 
-		if station1 == None and station2 == None:
-			return 0
+		if self.filteridle != None:
+			gobject.source_remove(self.filteridle)
+			self.filteridle = None
 
-		elif station1 == None:
-			return 1
+		if self.matches == None:
+			self.target = self.sorted[:]
 
-		elif station2 == None:
-			return -1
+		else:
+			self.target = [ row for row in self.sorted if self.matches.has_key(row[1]) == True ]
+
+		# the view is detached while its model is replaced
+		self.set_model(None)
+		self.stationmodel.set_view(self.target[:])
+		self.set_model(self.stationmodel)
+
+		self.cursor = len(self.target)
+
+
+	def __refilter(self, text):
+		"Searches for a text, and starts moving the shown rows towards the result"
+
+		previous	= self.matches
+		index		= self.__get_index()
+
+		# a text containing the previous one can only match a subset
+		if previous != None and self.filtertext in text:
+			self.matches	= index.search(text, previous)
+			self.target	= [ row for row in self.target if self.matches.has_key(row[1]) == True ]
+
+		elif self.matches == None and text == "":
+			return
+
+		else:
+			self.matches = index.search(text)
+
+			if self.matches == None:
+				self.target = self.sorted[:]
+
+			else:
+				self.target = [ row for row in self.sorted if self.matches.has_key(row[1]) == True ]
+
+		self.filtertext	= text
+		self.cursor	= 0
+
+		# a search arriving before the previous one is shown just
+		# continues the merge, towards the newer target
+		if self.filteridle == None:
+			self.filteridle = gobject.idle_add(self.__cb_filter_idle)
+
+
+	def __shift_rows(self, start, offset):
+		"Shifts the indices of rows from a position"
+
+		for row in self.rows[start:]:
+			row[2] += offset
+
+
+	def __show_row(self, row, station):
+		"Adds a row to the sorted rows, and shows it if it matches the search"
+
+		bisect.insort(self.sorted, row)
+
+		if self.matches != None:
+			if self.index.match(row[1], self.filtertext) == False:
+				return
+
+			self.matches[row[1]] = None
+
+		bisect.insort(self.target, row)
+		self.stationmodel.insert_row(bisect.bisect_left(self.stationmodel.view, row), row)
+
+		self.cursor = 0
+
+
+	def apply_changes(self, stationlist, changes):
+		"Updates the rows of changed stations, keeping the selection"
+
+		path		= None
+		selected	= None
+
+		if self.get_selected() != None:
+			path		= self.stationmodel.get_path(self.get_selected())
+			selected	= self.stationmodel.get_value(self.get_selected(), 2)
 
-		return cmp(station1.name.lower(), station2.name.lower())
+		# large batches are cheaper to rebuild than to apply row by row
+		if len(changes) > 100:
+			self.set_stations(stationlist)
+			changes = []
+
+		# the stations are taken from the changes, as the indices are
+		# only valid at the point in the batch where each was made
+		for kind, index, station in changes:
+			if kind == media.CHANGE_ADD:
+				self.rowkey += 1
+				row = [ self.__get_sort_key(station, self.rowkey), self.rowkey, index ]
+
+				self.rows.insert(index, row)
+				self.__shift_rows(index + 1, 1)
+				self.keyrows[row[1]] = row
+
+				if self.index != None:
+					self.index.add(row[1], station)
+
+				self.__show_row(row, station)
+
+			elif kind == media.CHANGE_REMOVE:
+				row = self.rows.pop(index)
+
+				self.__shift_rows(index, -1)
+				self.__hide_row(row)
+				del self.keyrows[row[1]]
+
+				if self.index != None:
+					self.index.remove(row[1])
+
+			elif kind == media.CHANGE_UPDATE:
+				row = self.rows[index]
+
+				if self.index != None:
+					self.index.add(row[1], station)
+
+				# the row is moved, as its sort key may have changed
+				self.__hide_row(row)
+				row[0] = self.__get_sort_key(station, row[1])
+				self.__show_row(row, station)
+
+		if path == None or self.get_selected() != None:
+			return
+
+		# keep the selected row selected, or select the one which took its place
+		view		= self.stationmodel.view
+		position	= bisect.bisect_left(view, selected)
+
+		if position == len(view) or view[position] is not selected:
+			position = min(path[0], len(view) - 1)
+
+		if position >= 0:
+			self.select(self.stationmodel.get_iter(( position, )))
 
 
 	def filter(self, text):
-		"Filters the list"
+		"Filters the list, once typing has paused"
 
-		self.filtertext = text
-		self.filtermodel.refilter()
+		self.filterquery = text
 
-		try:
-			self.select(self.filtermodel.get_iter("0"))
+		if self.filtertimer != None:
+			gobject.source_remove(self.filtertimer)
 
-		except ValueError:
-			self.unselect_all()
+		self.filtertimer = gobject.timeout_add(self.filterdelay, self.__cb_filter_timer)
+
+
+	def get_neighbours(self, station):
+		"Returns the stations shown just before and after a station"
+
+		stations	= self.stationlist.get_stations()
+		view		= self.stationmodel.view
+		iter		= self.get_selected()
+
+		# the station is usually the selected one
+		if iter != None and self.stationmodel.get_value(iter, 1) == station:
+			position = self.stationmodel.get_path(iter)[0]
+
+		else:
+			for position in range(len(view)):
+				if stations[view[position][2]] == station:
+					break
+
+			else:
+				return []
+
+		neighbours = []
+
+		for position in position - 1, position + 1:
+			if 0 <= position < len(view):
+				neighbours.append(stations[view[position][2]])
+
+		return neighbours
 
 
 	def get_selected_index(self):
@@ -1148,7 +1431,7 @@ class StationList(TreeView):
 		if iter == None:
 			return None
 
-		return self.filtermodel.get_value(iter, 2)
+		return self.stationmodel.get_value(iter, 2)[2]
 
 
 	def get_selected_station(self):
@@ -1159,21 +1442,222 @@ class StationList(TreeView):
 		if iter == None:
 			return None
 
-		return self.filtermodel.get_value(iter, 1)
+		return self.stationmodel.get_value(iter, 1)
+
+
+	def set_sort(self, order):
+		"Sets the sort order, one of the SORT_* constants"
+
+		self.sort = order
+
+		for row, station in zip(self.rows, self.stationlist.get_stations()):
+			row[0] = self.__get_sort_key(station, row[1])
+
+		self.sorted = self.rows[:]
+		self.sorted.sort()
+
+		self.__rebuild()
 
 
 	def set_stations(self, stationlist):
 		"Sets the stations"
 
-		self.liststore.clear()
+		self.stationlist		= stationlist
+		self.stationmodel.stationlist	= stationlist
+
+		self.index	= None
+		self.keyrows	= {}
+		self.rows	= []
 
 		stations = stationlist.get_stations()
 
+		# this is one pass to build the sort keys and one sort, so
+		# opening the list is O(n log n) in the number of stations
 		for index, station in zip(range(len(stations)), stations):
-			text = "<b>%s</b>\n%s\n%s" % ( util.escape_markup(station.name), util.escape_markup(station.description), util.escape_markup(station.website) )
-			text = re.sub("\n+", "\n", text).strip()
+			self.rowkey += 1
+
+			row = [ self.__get_sort_key(station, self.rowkey), self.rowkey, index ]
+			self.rows.append(row)
+			self.keyrows[row[1]] = row
+
+		self.sorted = self.rows[:]
+		self.sorted.sort()
+
+		self.stationmodel.cachesize = 2 * len(self.rows) + 1000
+
+		if self.matches != None:
+			self.matches = self.__get_index().search(self.filtertext)
+
+		self.__rebuild()
+
+
+
+class StationModel(gtk.GenericTreeModel):
+	"A list model of station rows, which renders stations only as they are drawn"
+
+	def __init__(self, stationlist):
+		gtk.GenericTreeModel.__init__(self)
+
+		# rows are referenced by their row lists, which are kept alive
+		# by the station list view, so iterators needn't hold references
+		self.set_property("leak-references", False)
+
+		self.stationlist	= stationlist
+		self.view		= []
+
+		# markup is cached per station, along with the station version
+		# it was rendered from, and the cache is emptied once it has
+		# grown past the size, as it then holds removed stations
+		self.cache	= {}
+		self.cachesize	= 1000
+		self.hits	= 0
+		self.misses	= 0
+
+
+	def __get_text(self, station):
+		"Returns the markup for a station"
+
+		version, text = self.cache.get(station, ( None, None ))
+
+		if version == station.version:
+			self.hits += 1
+			return text
+
+		self.misses += 1
+
+		if len(self.cache) >= self.cachesize:
+			self.cache.clear()
+
+		text = "<b>%s</b>\n%s\n%s" % ( util.escape_markup(station.name), util.escape_markup(station.description), util.escape_markup(station.website) )
+		text = re.sub("\n+", "\n", text).strip()
+
+		self.cache[station] = ( station.version, text )
+
+		return text
+
+
+	def __get_position(self, row):
+		"Returns the position of a shown row"
+
+		# the view is sorted, as rows compare in display order
+		return bisect.bisect_left(self.view, row)
+
+
+	def insert_row(self, position, row):
+		"Shows a row at a position"
+
+		self.view.insert(position, row)
+		self.row_inserted(( position, ), self.get_iter(( position, )))
+
+
+	def on_get_column_type(self, column):
+		"Returns the type of a column"
+
+		return ( gobject.TYPE_STRING, gobject.TYPE_PYOBJECT, gobject.TYPE_PYOBJECT )[column]
+
+
+	def on_get_flags(self):
+		"Returns the model flags"
+
+		return gtk.TREE_MODEL_LIST_ONLY
+
+
+	def on_get_iter(self, path):
+		"Returns the row reference for a path"
+
+		if path[0] < len(self.view):
+			return self.view[path[0]]
+
+		return None
+
+
+	def on_get_n_columns(self):
+		"Returns the number of columns"
+
+		return 3
+
+
+	def on_get_path(self, rowref):
+		"Returns the path of a row reference"
+
+		return ( self.__get_position(rowref), )
+
+
+	def on_get_value(self, rowref, column):
+		"Returns the markup, station or row of a row reference"
+
+		if column == 2:
+			return rowref
+
+		station = self.stationlist.get_station(rowref[2])
+
+		if column == 1:
+			return station
+
+		return self.__get_text(station)
+
+
+	def on_iter_children(self, parent):
+		"Returns the first row, for the root"
+
+		if parent == None and len(self.view) > 0:
+			return self.view[0]
 
-			self.liststore.append([ text, station, index ])
+		return None
+
+
+	def on_iter_has_child(self, rowref):
+		"Returns False, as rows have no children"
+
+		return False
+
+
+	def on_iter_n_children(self, rowref):
+		"Returns the number of rows, for the root"
+
+		if rowref == None:
+			return len(self.view)
+
+		return 0
+
+
+	def on_iter_next(self, rowref):
+		"Returns the row reference after another"
+
+		position = self.__get_position(rowref) + 1
+
+		if position < len(self.view):
+			return self.view[position]
+
+		return None
+
+
+	def on_iter_nth_child(self, parent, n):
+		"Returns the nth row, for the root"
+
+		if parent == None and n < len(self.view):
+			return self.view[n]
+
+		return None
+
+
+	def on_iter_parent(self, child):
+		"Returns None, as rows have no parent"
+
+		return None
+
+
+	def remove_row(self, position):
+		"Hides the row at a position"
+
+		del self.view[position]
+		self.row_deleted(( position, ))
+
+
+	def set_view(self, rows):
+		"Sets the rows to show, without notifying views"
+
+		self.view = rows
 
 
 
@@ -1251,11 +1735,93 @@ class StreamList(TreeView):
 
 		self.liststore.clear()
 
-		if type(streams) == list:
+		if type(streams) in ( list, tuple ):
 			for stream in streams:
 				self.add_stream(stream)
 
 
+
+class Ticker:
+	"Runs periodic display refreshes from a single timer"
+
+	def __init__(self, interval = 250):
+		self.interval	= interval
+		self.jobs	= {}
+		self.ticks	= 0
+		self.timer	= None
+
+		# each timer gets a new sequence number, so that a timer
+		# which has been replaced can tell and stop itself
+		self.sequence	= 0
+
+
+	def __cb_timer(self, sequence):
+		"Callback for running the refreshes due on a tick"
+
+		self.ticks += 1
+
+		for purpose, ( callback, every ) in self.jobs.items():
+			if self.ticks % every == 0 and callback() == False and self.jobs.has_key(purpose) == True:
+				del self.jobs[purpose]
+
+		# a callback may have removed the timer and started another
+		if sequence != self.sequence:
+			return False
+
+		elif len(self.jobs) > 0:
+			return True
+
+		self.timer = None
+
+		return False
+
+
+	def __start(self):
+		"Starts a new timer"
+
+		self.sequence	+= 1
+		self.timer	= gobject.timeout_add(self.interval, self.__cb_timer, self.sequence)
+
+
+	def add(self, purpose, callback, every = 1):
+		"Runs a callback every given number of ticks, until it returns False"
+
+		# there is only one callback per purpose, so adding one again
+		# doesn't stack another refresh
+		self.jobs[purpose] = ( callback, max(every, 1) )
+
+		if self.timer == None:
+			self.__start()
+
+
+	def has(self, purpose):
+		"Returns True if a refresh is running for a purpose"
+
+		return self.jobs.has_key(purpose)
+
+
+	def remove(self, purpose):
+		"Stops the refresh for a purpose"
+
+		if self.jobs.has_key(purpose) == True:
+			del self.jobs[purpose]
+
+		if len(self.jobs) == 0 and self.timer != None:
+			gobject.source_remove(self.timer)
+			self.timer = None
+
+
+	def set_interval(self, interval):
+		"Sets the time between ticks, in milliseconds"
+
+		self.interval = interval
+
+		if self.timer != None:
+			gobject.source_remove(self.timer)
+			self.__start()
+
+
+
 class Tooltips(gtk.Tooltips):
 	"A tooltip handler"
 
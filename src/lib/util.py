@@ -23,19 +23,27 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 #
 
-import math, os, re, StringIO, traceback
+import math, os, random, re, StringIO, traceback
+
+
+def backoff(attempt, base, maximum):
+	"Returns an exponential backoff delay with jitter, in seconds"
+
+	delay = min(base * 2 ** attempt, maximum)
+
+	return random.uniform(delay / 2.0, delay)
 
 
 def dom_text(node):
 	"Returns text content of a DOM node"
 
-	text = ""
+	text = []
 
 	for child in node.childNodes:
 		if child.nodeType == node.TEXT_NODE:
-			text += child.nodeValue.encode("utf-8")
+			text.append(child.nodeValue)
 
-	return text
+	return "".join(text).encode("utf-8")
 
 
 def escape_markup(string):